@@ -12,7 +12,7 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
-def create_app(config_name=None):
+def create_app(config_name=None, test_config=None):
     """Create and configure the Flask application"""
     app = Flask(__name__)
     
@@ -23,6 +23,18 @@ def create_app(config_name=None):
         'sqlite:///hospital_crm.db'
     )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Stale pooled connections are replaced on checkout
+    engine_options = {'pool_pre_ping': True}
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        engine_options.update(
+            pool_size=int(os.environ.get('DB_POOL_SIZE', 10)),
+            max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 20))
+        )
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+    
+    # Overrides must land before db.init_app, which builds the engine
+    if test_config:
+        app.config.update(test_config)
     
     # Initialize database
     from models import db
@@ -91,6 +103,10 @@ def create_app(config_name=None):
     with app.app_context():
         try:
             db.create_all()
+            # Databases created before the search index existed
+            from models import create_patient_fts
+            with db.engine.begin() as connection:
+                app.extensions['patient_fts'] = create_patient_fts(connection)
             create_default_data()
             print("✅ Database initialized successfully!")
         except Exception as e:
@@ -76,6 +76,7 @@ class Config:
     # Monitoring settings
     SENTRY_DSN = os.environ.get('SENTRY_DSN')
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_ROTATION = os.environ.get('LOG_ROTATION', 'external')  # 'external' (logrotate) or 'builtin'
     
     # Backup settings
     AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
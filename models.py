@@ -2,6 +2,8 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date, timezone
 from enum import Enum
@@ -141,6 +143,59 @@ class Patient(db.Model):
             return today.year - self.date_of_birth.year - ((today.month, today.day) < (self.date_of_birth.month, self.date_of_birth.day))
         return None
 
+# Full-text index over the searchable patient columns (SQLite FTS5 only).
+# External-content table: the triggers keep it in step with `patients`.
+# The trigram tokenizer answers substring matches, the same as ILIKE '%term%'.
+PATIENT_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS patient_fts USING fts5("
+    "patient_id, first_name, last_name, phone, content='patients', content_rowid='id', "
+    "tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS patient_fts_ai AFTER INSERT ON patients BEGIN "
+    "INSERT INTO patient_fts(rowid, patient_id, first_name, last_name, phone) "
+    "VALUES (new.id, new.patient_id, new.first_name, new.last_name, new.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS patient_fts_ad AFTER DELETE ON patients BEGIN "
+    "INSERT INTO patient_fts(patient_fts, rowid, patient_id, first_name, last_name, phone) "
+    "VALUES ('delete', old.id, old.patient_id, old.first_name, old.last_name, old.phone); END",
+    "CREATE TRIGGER IF NOT EXISTS patient_fts_au AFTER UPDATE ON patients BEGIN "
+    "INSERT INTO patient_fts(patient_fts, rowid, patient_id, first_name, last_name, phone) "
+    "VALUES ('delete', old.id, old.patient_id, old.first_name, old.last_name, old.phone); "
+    "INSERT INTO patient_fts(rowid, patient_id, first_name, last_name, phone) "
+    "VALUES (new.id, new.patient_id, new.first_name, new.last_name, new.phone); END",
+)
+
+def create_patient_fts(connection):
+    """Create the patient search index on SQLite, backfilling existing rows
+    
+    SQLite builds without FTS5, or older than 3.34 (no trigram tokenizer),
+    get no index; patient search then falls back to ILIKE. Returns whether
+    the index is available.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patient_fts'"
+    ).first()
+    try:
+        connection.exec_driver_sql(PATIENT_FTS_DDL[0])
+    except OperationalError:
+        # no such module: fts5 / no such tokenizer: trigram
+        return False
+    for statement in PATIENT_FTS_DDL[1:]:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        connection.exec_driver_sql("INSERT INTO patient_fts(patient_fts) VALUES ('rebuild')")
+    return True
+
+@event.listens_for(Patient.__table__, 'after_create')
+def _create_patient_fts(target, connection, **kw):
+    create_patient_fts(connection)
+
+@event.listens_for(Patient.__table__, 'before_drop')
+def _drop_patient_fts(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS patient_fts')
+
 # Enhanced Visit Model
 class Visit(db.Model):
     __tablename__ = 'visits'
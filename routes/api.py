@@ -1,8 +1,11 @@
 # routes/api.py - REST API endpoints
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from datetime import datetime, date, timedelta
+import time
+from sqlalchemy import literal_column, select, table, text
+from sqlalchemy.orm import contains_eager, raiseload
 from models import (
     db, Patient, Appointment, Visit, Billing, Payment, User,
     AppointmentStatus, PaymentStatus, UserRole, VisitType
@@ -74,6 +77,48 @@ def serialize_appointment(appointment):
         'created_at': appointment.created_at.isoformat()
     }
 
+def _has_patient_fts():
+    """Whether the database has the trigram patient index
+    
+    create_app records this at startup; otherwise it is looked up once.
+    """
+    available = current_app.extensions.get('patient_fts')
+    if available is None:
+        available = db.engine.dialect.name == 'sqlite' and db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patient_fts'")
+        ).first() is not None
+        current_app.extensions['patient_fts'] = available
+    return available
+
+def patient_search_filter(query):
+    """Build the patient filter for a free-text search term
+    
+    Every backend matches the term as a case-insensitive substring of the
+    name, phone or patient ID.
+    """
+    if len(query) >= 3 and _has_patient_fts():
+        # Same substring match, answered from the trigram FTS5 index
+        # (trigrams need at least three characters)
+        phrase = '"%s"' % query.replace('"', '""')
+        matches = select(literal_column('rowid')).select_from(table('patient_fts')).where(
+            text('patient_fts MATCH :phrase').bindparams(phrase=phrase)
+        )
+        return Patient.id.in_(matches)
+    
+    search_term = f"%{query}%"
+    return db.or_(
+        Patient.first_name.ilike(search_term),
+        Patient.last_name.ilike(search_term),
+        Patient.phone.ilike(search_term),
+        Patient.patient_id.ilike(search_term)
+    )
+
+def _conditional_json(data):
+    """JSON response with an ETag; 304 when the client already has it"""
+    response = jsonify(data)
+    response.add_etag()
+    return response.make_conditional(request)
+
 # API Routes
 
 @api_bp.route('/patients', methods=['GET'])
@@ -84,32 +129,34 @@ def api_get_patients():
     per_page = min(request.args.get('per_page', 20, type=int), 100)
     search = request.args.get('search', '')
     
-    query = Patient.query.filter_by(is_active=True)
+    # serialize_patient only reads columns; fail loudly if that changes
+    query = Patient.query.options(raiseload('*')).filter_by(is_active=True)
     
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            db.or_(
-                Patient.first_name.ilike(search_term),
-                Patient.last_name.ilike(search_term),
-                Patient.phone.ilike(search_term),
-                Patient.patient_id.ilike(search_term)
-            )
-        )
+        query = query.filter(patient_search_filter(search))
     
-    patients = query.order_by(Patient.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    # Same bounds handling as paginate(error_out=False)
+    page = max(page, 1)
+    if per_page < 1:
+        per_page = 20
+    
+    total = query.order_by(None).count()
+    pages = -(-total // per_page)
+    
+    # Serialize the page as rows arrive instead of materializing it first
+    page_query = query.order_by(Patient.created_at.desc()).limit(per_page).offset(
+        (page - 1) * per_page
+    ).yield_per(50)
     
     return jsonify({
-        'patients': [serialize_patient(p) for p in patients.items],
+        'patients': [serialize_patient(p) for p in page_query],
         'pagination': {
-            'page': patients.page,
-            'pages': patients.pages,
-            'per_page': patients.per_page,
-            'total': patients.total,
-            'has_next': patients.has_next,
-            'has_prev': patients.has_prev
+            'page': page,
+            'pages': pages,
+            'per_page': per_page,
+            'total': total,
+            'has_next': page < pages,
+            'has_prev': page > 1
         }
     })
 
@@ -146,6 +193,36 @@ def api_get_patient(id):
     
     return jsonify(patient_data)
 
+@api_bp.route('/patients/<int:id>/appointments', methods=['GET'])
+@login_required
+def api_get_patient_appointments(id):
+    """Get a patient's appointments"""
+    patient = Patient.query.get_or_404(id)
+    
+    if not patient.is_active:
+        return jsonify({'error': 'Patient not found'}), 404
+    
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    upcoming = request.args.get('upcoming', 0, type=int)
+    
+    query = Appointment.query.filter_by(patient_id=id)
+    if current_user.role == UserRole.DOCTOR:
+        query = query.filter_by(doctor_id=current_user.id)
+    
+    if upcoming:
+        query = query.filter(Appointment.appointment_date >= date.today()).order_by(
+            Appointment.appointment_date, Appointment.appointment_time
+        )
+    else:
+        query = query.order_by(
+            Appointment.appointment_date.desc(),
+            Appointment.appointment_time.desc()
+        )
+    
+    return jsonify({
+        'appointments': [serialize_appointment(a) for a in query.limit(limit).all()]
+    })
+
 @api_bp.route('/appointments', methods=['GET'])
 @login_required
 def api_get_appointments():
@@ -196,6 +273,18 @@ def api_get_appointments():
         }
     })
 
+@api_bp.route('/appointments/<int:id>', methods=['GET'])
+@login_required
+def api_get_appointment(id):
+    """Get appointment details"""
+    appointment = Appointment.query.get_or_404(id)
+    
+    # Check permissions
+    if (current_user.role == UserRole.DOCTOR and appointment.doctor_id != current_user.id):
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    return jsonify({'appointment': serialize_appointment(appointment)})
+
 @api_bp.route('/appointments', methods=['POST'])
 @login_required
 def api_create_appointment():
@@ -308,8 +397,16 @@ def api_update_appointment_status(id):
 def api_dashboard_stats():
     """Get dashboard statistics"""
     try:
-        stats = {}
         today = date.today()
+        # Per-app cache of (user, day) -> (expires_at, stats)
+        stats_cache = current_app.extensions.setdefault('dashboard_stats_cache', {})
+        cache_key = (current_user.id, today)
+        now = time.monotonic()
+        cached = stats_cache.get(cache_key)
+        if cached and cached[0] > now:
+            return _conditional_json(cached[1])
+        
+        stats = {}
         
         if current_user.role in [UserRole.SUPER_ADMIN, UserRole.ADMIN]:
             stats = {
@@ -331,7 +428,15 @@ def api_dashboard_stats():
                 ).distinct().count()
             }
         
-        return jsonify(stats)
+        # Drop expired entries (earlier days included) so the cache only ever
+        # holds users seen within the last TTL
+        for key, (expires_at, _) in list(stats_cache.items()):
+            if expires_at <= now:
+                stats_cache.pop(key, None)
+        
+        ttl = current_app.config.get('DASHBOARD_STATS_TTL', 60)
+        stats_cache[cache_key] = (time.monotonic() + ttl, stats)
+        return _conditional_json(stats)
         
     except Exception as e:
         return jsonify({'error': f'Failed to get stats: {str(e)}'}), 500
@@ -350,13 +455,8 @@ def api_search():
     
     try:
         # Search patients
-        patients = Patient.query.filter(
-            db.or_(
-                Patient.first_name.ilike(search_term),
-                Patient.last_name.ilike(search_term),
-                Patient.phone.ilike(search_term),
-                Patient.patient_id.ilike(search_term)
-            ),
+        patients = Patient.query.options(raiseload('*')).filter(
+            patient_search_filter(query),
             Patient.is_active == True
         ).limit(5).all()
         
@@ -371,14 +471,18 @@ def api_search():
         
         # Search appointments (based on user role)
         if current_user.role in [UserRole.SUPER_ADMIN, UserRole.ADMIN, UserRole.STAFF]:
-            appointments = Appointment.query.join(Patient).filter(
+            appointments = Appointment.query.join(Patient).options(
+                contains_eager(Appointment.patient)
+            ).filter(
                 db.or_(
                     Patient.first_name.ilike(search_term),
                     Patient.last_name.ilike(search_term)
                 )
             ).order_by(Appointment.appointment_date.desc()).limit(5).all()
         elif current_user.role == UserRole.DOCTOR:
-            appointments = Appointment.query.join(Patient).filter(
+            appointments = Appointment.query.join(Patient).options(
+                contains_eager(Appointment.patient)
+            ).filter(
                 Appointment.doctor_id == current_user.id,
                 db.or_(
                     Patient.first_name.ilike(search_term),
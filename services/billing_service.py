@@ -6,11 +6,38 @@ from models import (
     PaymentStatus, VisitType
 )
 from services.whatsapp_service import WhatsAppService
+from functools import lru_cache
+from typing import NamedTuple
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
+class BillBreakdown(NamedTuple):
+    subtotal: float
+    discount_amount: float
+    taxable_amount: float
+    tax_amount: float
+    total_amount: float
+
+@lru_cache(maxsize=256)
+def _bill_breakdown(subtotal, discount_amount, tax_percent):
+    """Fixed discount off the subtotal, then tax on the discounted amount
+    
+    The single billing formula: create_bill stores these figures and
+    calculate_bill_amount quotes them.
+    """
+    discount_amount = round(discount_amount, 2)
+    taxable_amount = round(subtotal - discount_amount, 2)
+    tax_amount = round(taxable_amount * tax_percent / 100, 2)
+    return BillBreakdown(
+        subtotal=subtotal,
+        discount_amount=discount_amount,
+        taxable_amount=taxable_amount,
+        tax_amount=tax_amount,
+        total_amount=round(taxable_amount + tax_amount, 2)
+    )
+
 class BillingService:
     def __init__(self):
         self.whatsapp_service = WhatsAppService()
@@ -60,8 +87,7 @@ class BillingService:
                     subtotal += item.get('amount', 0)
             
             # Calculate tax and total
-            tax_amount = subtotal * (tax_rate / 100)
-            total_amount = subtotal - discount_amount + tax_amount
+            breakdown = _bill_breakdown(float(subtotal), float(discount_amount), float(tax_rate))
             
             # Generate bill number
             bill_number = self.generate_bill_number()
@@ -72,9 +98,9 @@ class BillingService:
                 patient_package_id=patient_package_id,
                 bill_number=bill_number,
                 subtotal=subtotal,
-                discount_amount=discount_amount,
-                tax_amount=tax_amount,
-                total_amount=total_amount,
+                discount_amount=breakdown.discount_amount,
+                tax_amount=breakdown.tax_amount,
+                total_amount=breakdown.total_amount,
                 payment_status=PaymentStatus.PENDING
             )
             
@@ -92,6 +118,13 @@ class BillingService:
             logger.error(f"Error creating bill: {str(e)}")
             return None, f"Error creating bill: {str(e)}"
     
+    def calculate_bill_amount(self, subtotal, discount_percent=0, tax_percent=0):
+        """Calculate discount, tax and total for a subtotal"""
+        subtotal = float(subtotal)
+        discount_amount = round(subtotal * float(discount_percent) / 100, 2)
+        # Price lists repeat the same inputs; the breakdown is cached
+        return _bill_breakdown(subtotal, discount_amount, float(tax_percent))._asdict()
+    
     def process_payment(self, billing_id, amount, payment_method, transaction_id=None, notes=None):
         """Process a payment for a bill"""
         try:
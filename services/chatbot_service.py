@@ -4,6 +4,7 @@ import os
 import openai
 import json
 import re
+from functools import lru_cache
 from datetime import datetime, date, timedelta
 from models import (
     db, Patient, Appointment, User, TreatmentPackage, 
@@ -14,6 +15,88 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Intent keywords, in priority order
+INTENT_PATTERNS = {
+    'book_appointment': [
+        'book appointment', 'schedule appointment', 'make appointment',
+        'book', 'appointment', 'schedule', 'visit'
+    ],
+    'check_appointment': [
+        'check appointment', 'my appointment', 'appointment status',
+        'when is my appointment'
+    ],
+    'cancel_appointment': [
+        'cancel appointment', 'cancel my appointment', 'reschedule'
+    ],
+    'package_inquiry': [
+        'package', 'packages', 'treatment package', 'pricing',
+        'cost', 'price', 'how much'
+    ],
+    'clinic_info': [
+        'address', 'location', 'timing', 'hours', 'contact',
+        'phone number', 'where are you'
+    ],
+    'greeting': [
+        'hello', 'hi', 'hey', 'good morning', 'good afternoon',
+        'good evening', 'namaste'
+    ],
+    'help': [
+        'help', 'what can you do', 'options', 'menu'
+    ]
+}
+
+_KEYWORD_INTENT = {}
+for _intent_name, _keywords in INTENT_PATTERNS.items():
+    for _keyword in _keywords:
+        _KEYWORD_INTENT.setdefault(_keyword, _intent_name)
+_INTENT_RANK = {name: rank for rank, name in enumerate(INTENT_PATTERNS)}
+
+# One compiled scan over the message finds every keyword; the lookahead is
+# zero-width so overlapping keywords ("appointment", "appointment status")
+# are all reported, and alternation order puts higher-priority intents first.
+_KEYWORD_SCAN = re.compile('(?=(%s))' % '|'.join(map(re.escape, _KEYWORD_INTENT)))
+
+@lru_cache(maxsize=1024)
+def _analyze_text(message_lower):
+    """Extract intent and entities from lower-cased message text"""
+    # Cached: entities are returned as item tuples so callers can't mutate them
+    
+    # Extract entities
+    entities = {}
+    
+    # Extract dates
+    date_patterns = [
+        r'\b(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})\b',
+        r'\b(today|tomorrow|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b',
+        r'\b(\d{1,2})(st|nd|rd|th)?\s+(january|february|march|april|may|june|july|august|september|october|november|december)\b'
+    ]
+    
+    for pattern in date_patterns:
+        matches = re.findall(pattern, message_lower)
+        if matches:
+            entities['date'] = matches[0]
+            break
+    
+    # Extract times
+    time_pattern = r'\b(\d{1,2}):?(\d{2})?\s*(am|pm|morning|afternoon|evening)?\b'
+    time_matches = re.findall(time_pattern, message_lower)
+    if time_matches:
+        entities['time'] = time_matches[0]
+    
+    # Extract visit type
+    if any(word in message_lower for word in ['home', 'home visit']):
+        entities['visit_type'] = 'home'
+    elif any(word in message_lower for word in ['online', 'video', 'virtual']):
+        entities['visit_type'] = 'online'
+    else:
+        entities['visit_type'] = 'clinic'
+    
+    # Determine intent: the highest-priority intent with any keyword present
+    matched = {_KEYWORD_INTENT[match.group(1)] for match in _KEYWORD_SCAN.finditer(message_lower)}
+    intent = min(matched, key=_INTENT_RANK.__getitem__, default='unknown')
+    
+    return intent, tuple(entities.items())
+
 class ChatbotService:
     def __init__(self):
         self.openai_api_key = os.environ.get('OPENAI_API_KEY')
@@ -86,76 +169,12 @@ class ChatbotService:
     
     def analyze_message(self, message_text):
         """Analyze message to extract intent and entities"""
-        message_lower = message_text.lower()
-        
-        # Define intent patterns
-        intent_patterns = {
-            'book_appointment': [
-                'book appointment', 'schedule appointment', 'make appointment',
-                'book', 'appointment', 'schedule', 'visit'
-            ],
-            'check_appointment': [
-                'check appointment', 'my appointment', 'appointment status',
-                'when is my appointment'
-            ],
-            'cancel_appointment': [
-                'cancel appointment', 'cancel my appointment', 'reschedule'
-            ],
-            'package_inquiry': [
-                'package', 'packages', 'treatment package', 'pricing',
-                'cost', 'price', 'how much'
-            ],
-            'clinic_info': [
-                'address', 'location', 'timing', 'hours', 'contact',
-                'phone number', 'where are you'
-            ],
-            'greeting': [
-                'hello', 'hi', 'hey', 'good morning', 'good afternoon',
-                'good evening', 'namaste'
-            ],
-            'help': [
-                'help', 'what can you do', 'options', 'menu'
-            ]
-        }
-        
-        # Extract entities
-        entities = {}
-        
-        # Extract dates
-        date_patterns = [
-            r'\b(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})\b',
-            r'\b(today|tomorrow|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b',
-            r'\b(\d{1,2})(st|nd|rd|th)?\s+(january|february|march|april|may|june|july|august|september|october|november|december)\b'
-        ]
-        
-        for pattern in date_patterns:
-            matches = re.findall(pattern, message_lower)
-            if matches:
-                entities['date'] = matches[0]
-                break
-        
-        # Extract times
-        time_pattern = r'\b(\d{1,2}):?(\d{2})?\s*(am|pm|morning|afternoon|evening)?\b'
-        time_matches = re.findall(time_pattern, message_lower)
-        if time_matches:
-            entities['time'] = time_matches[0]
-        
-        # Extract visit type
-        if any(word in message_lower for word in ['home', 'home visit']):
-            entities['visit_type'] = 'home'
-        elif any(word in message_lower for word in ['online', 'video', 'virtual']):
-            entities['visit_type'] = 'online'
-        else:
-            entities['visit_type'] = 'clinic'
-        
-        # Determine intent
-        intent = 'unknown'
-        for intent_name, keywords in intent_patterns.items():
-            if any(keyword in message_lower for keyword in keywords):
-                intent = intent_name
-                break
-        
-        return intent, entities
+        intent, entities = _analyze_text(message_text.lower())
+        return intent, dict(entities)
+    
+    def _extract_intent(self, message_text):
+        """Classify a message into one of the known intents"""
+        return _analyze_text(message_text.lower())[0]
     
     def generate_response(self, conversation, intent, entities, message_text):
         """Generate appropriate response based on intent"""
@@ -1,33 +1,144 @@
 # tests/conftest.py - Test Configuration and Fixtures
 
-import pytest
-import tempfile
 import os
-from app_enhanced import create_app
-from models import db, User, Patient, Appointment, UserRole, AppointmentStatus, VisitType
+import sqlite3
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
+from app import create_app
+from models import db, User, Patient, Appointment, Visit, UserRole, AppointmentStatus, VisitType
 from datetime import date, time, datetime
 
-@pytest.fixture
-def app():
-    """Create and configure a new app instance for each test."""
-    # Create a temporary file to serve as the database
-    db_fd, db_path = tempfile.mkstemp()
-    
-    app = create_app()
-    app.config.update({
+# The real KDF, for tests marked real_password_hashing
+_REAL_PASSWORD_METHODS = {
+    'set_password': User.set_password,
+    'check_password': User.check_password,
+}
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'real_password_hashing: run with the real password KDF instead of the test stub'
+    )
+
+@pytest.fixture(scope='session', autouse=True)
+def fast_password_hashing():
+    """Swap the slow password KDF for a plain marker while testing.
+
+    Only the password-security tests measure real hashing; they opt back in
+    with the real_password_hashing marker. Run with FAST_CRYPTO=0 to use the
+    real werkzeug hashing everywhere.
+    """
+    if os.environ.get('FAST_CRYPTO', '1') != '1':
+        yield
+        return
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(User, 'set_password',
+                   lambda self, password: setattr(self, 'password_hash', f'plain:{password}'))
+        mp.setattr(User, 'check_password',
+                   lambda self, password: self.password_hash == f'plain:{password}')
+        yield
+
+@pytest.fixture(autouse=True)
+def real_password_hashing(request):
+    """Restore the real KDF for tests marked real_password_hashing."""
+    if request.node.get_closest_marker('real_password_hashing') is None:
+        yield
+        return
+
+    with pytest.MonkeyPatch.context() as mp:
+        for name, method in _REAL_PASSWORD_METHODS.items():
+            mp.setattr(User, name, method)
+        yield
+
+def _configure_sqlite(engine):
+    """Let pysqlite honour SAVEPOINTs so per-test rollbacks work."""
+    @event.listens_for(engine, 'connect')
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute('PRAGMA synchronous=OFF')
+        dbapi_connection.execute('PRAGMA journal_mode=MEMORY')
+
+    @event.listens_for(engine, 'begin')
+    def do_begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+@pytest.fixture(scope='session')
+def schema_template():
+    """Build the schema once into an in-memory database modules copy from."""
+    template = sqlite3.connect(':memory:', check_same_thread=False)
+    engine = create_engine('sqlite://', creator=lambda: template, poolclass=StaticPool)
+    db.metadata.create_all(engine)
+    yield template
+    template.close()
+
+@pytest.fixture(scope='module')
+def app(schema_template):
+    """Create and configure a new app instance for each test module."""
+    app = create_app(test_config={
         "TESTING": True,
-        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_path}",
+        # In-memory database: nothing here exercises WAL or crash recovery.
+        # StaticPool hands every app context the same connection, so the
+        # schema stays visible for the lifetime of the module, and the
+        # concurrent/burst load tests never wait on connection setup.
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "SQLALCHEMY_ENGINE_OPTIONS": {
+            "poolclass": StaticPool,
+            "connect_args": {"check_same_thread": False},
+            "query_cache_size": 1200
+        },
         "WTF_CSRF_ENABLED": False,
         "SECRET_KEY": "test-secret-key"
     })
 
     with app.app_context():
-        db.create_all()
-        yield app
-        db.drop_all()
+        # Commits inside a test only release a SAVEPOINT (see db_transaction)
+        db.session.configure(join_transaction_mode='create_savepoint')
+        # Never copy the schema over, or tune, a database the overrides missed
+        url = db.engine.url
+        if url.get_backend_name() != 'sqlite' or url.database not in (None, '', ':memory:'):
+            pytest.exit(f'Refusing to run the suite against {url!r}', returncode=1)
+        _configure_sqlite(db.engine)
+        db.engine.dispose()
+        # Page-copy the prebuilt schema instead of replaying the DDL
+        raw_connection = db.engine.raw_connection()
+        try:
+            schema_template.backup(raw_connection.driver_connection)
+        finally:
+            raw_connection.close()
+
+    # No app context is held across the module: requests and fixtures push
+    # their own, so g and the session are torn down after each one
+    yield app
+
+    with app.app_context():
+        # Closing the only connection discards the in-memory database
+        db.engine.dispose()
+
+@pytest.fixture(autouse=True)
+def db_transaction(request):
+    """Wrap every app-backed test in a transaction that is rolled back.
+
+    Module-scoped rows (test_doctor, test_patient) are committed once and
+    survive; anything a test writes on top of them is discarded.
+    """
+    if 'app' not in request.fixturenames:
+        yield
+        return
+
+    app = request.getfixturevalue('app')
+    with app.app_context():
+        engines = db.engines  # the app's own dict, so the swap outlives the context
+    engine = engines[None]
+    connection = engine.connect()
+    transaction = connection.begin()
+    engines[None] = connection
 
-    os.close(db_fd)
-    os.unlink(db_path)
+    yield
+
+    engines[None] = engine
+    transaction.rollback()
+    connection.close()
 
 @pytest.fixture
 def client(app):
@@ -57,9 +168,9 @@ def auth(client):
 
     return AuthActions(client)
 
-@pytest.fixture
+@pytest.fixture(scope='module')
 def test_user(app):
-    """Create a test user."""
+    """Create a test user once per module."""
     with app.app_context():
         user = User(
             username='testuser',
@@ -72,11 +183,13 @@ def test_user(app):
         user.set_password('testpass')
         db.session.add(user)
         db.session.commit()
+        db.session.refresh(user)
+        db.session.expunge(user)
         return user
 
-@pytest.fixture
+@pytest.fixture(scope='module')
 def test_doctor(app):
-    """Create a test doctor."""
+    """Create a test doctor once per module."""
     with app.app_context():
         doctor = User(
             username='testdoctor',
@@ -89,11 +202,14 @@ def test_doctor(app):
         doctor.set_password('doctorpass')
         db.session.add(doctor)
         db.session.commit()
+        # Hand out a loaded, detached copy; per-test writes never touch it
+        db.session.refresh(doctor)
+        db.session.expunge(doctor)
         return doctor
 
-@pytest.fixture
+@pytest.fixture(scope='module')
 def test_patient(app):
-    """Create a test patient."""
+    """Create a test patient once per module."""
     with app.app_context():
         patient = Patient(
             patient_id='P001',
@@ -110,8 +226,27 @@ def test_patient(app):
         )
         db.session.add(patient)
         db.session.commit()
+        db.session.refresh(patient)
+        db.session.expunge(patient)
         return patient
 
+@pytest.fixture(scope='module')
+def test_visit(app, test_patient, test_doctor):
+    """Create a completed clinic visit once per module."""
+    with app.app_context():
+        visit = Visit(
+            patient_id=test_patient.id,
+            doctor_id=test_doctor.id,
+            visit_type=VisitType.CLINIC,
+            date_of_visit=date.today(),
+            diagnosis='Test diagnosis'
+        )
+        db.session.add(visit)
+        db.session.commit()
+        db.session.refresh(visit)
+        db.session.expunge(visit)
+        return visit
+
 @pytest.fixture
 def test_appointment(app, test_patient, test_doctor):
     """Create a test appointment."""
@@ -127,13 +262,20 @@ def test_appointment(app, test_patient, test_doctor):
         )
         db.session.add(appointment)
         db.session.commit()
+        db.session.refresh(appointment)
+        db.session.expunge(appointment)
         return appointment
 
-@pytest.fixture
-def authenticated_client(client, test_user):
-    """A client with an authenticated user."""
-    client.post('/login', data={
-        'username': test_user.username,
-        'password': 'testpass'
-    })
+@pytest.fixture(scope='class')
+def authenticated_client(app, test_user):
+    """A client with an authenticated user, shared by a test class.
+
+    The Flask-Login session is written directly instead of posting to
+    /login, so no password check is paid per class. Tests that log out
+    should use ``client`` and ``auth`` instead.
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(test_user.id)
+        session['_fresh'] = True
     return client
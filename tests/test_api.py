@@ -47,6 +47,18 @@ class TestAPIEndpoints:
         found = any(p['first_name'] == 'Test' for p in data['patients'])
         assert found
     
+    @pytest.mark.parametrize('term', ['567892', '4567', 'est', 'p001'])
+    def test_api_patients_search_substring(self, authenticated_client, test_patient, term):
+        """Test that search matches substrings of the phone, name and patient ID"""
+        for url in (f'/api/patients?search={term}', f'/api/search?q={term}'):
+            response = authenticated_client.get(url)
+            assert response.status_code == 200
+            
+            data = json.loads(response.data)
+            ids = [p['id'] for p in data.get('patients', [])] + \
+                  [r['id'] for r in data.get('results', []) if r['type'] == 'patient']
+            assert test_patient.id in ids
+    
     def test_api_patient_detail(self, authenticated_client, test_patient):
         """Test GET /api/patients/<id>"""
         response = authenticated_client.get(f'/api/patients/{test_patient.id}')
@@ -59,6 +71,17 @@ class TestAPIEndpoints:
         assert 'recent_visits' in data
         assert 'upcoming_appointments' in data
     
+    @pytest.mark.parametrize('limit', [0, -5])
+    def test_api_patient_appointments_limit_clamped(self, authenticated_client, test_appointment, limit):
+        """Test that a non-positive limit still returns at least one appointment"""
+        response = authenticated_client.get(
+            f'/api/patients/{test_appointment.patient_id}/appointments?limit={limit}'
+        )
+        assert response.status_code == 200
+        
+        data = json.loads(response.data)
+        assert len(data['appointments']) == 1
+    
     def test_api_patient_not_found(self, authenticated_client):
         """Test patient not found"""
         response = authenticated_client.get('/api/patients/99999')
@@ -82,6 +105,17 @@ class TestAPIEndpoints:
         assert 'appointment_date' in appointment
         assert 'status' in appointment
     
+    def test_api_appointment_detail(self, authenticated_client, test_appointment):
+        """Test GET /api/appointments/<id>"""
+        response = authenticated_client.get(f'/api/appointments/{test_appointment.id}')
+        assert response.status_code == 200
+        
+        data = json.loads(response.data)
+        assert data['appointment']['id'] == test_appointment.id
+        
+        response = authenticated_client.get('/api/appointments/99999')
+        assert response.status_code == 404
+    
     def test_api_appointments_filter_by_date(self, authenticated_client, test_appointment):
         """Test appointment filtering by date"""
         today = date.today().strftime('%Y-%m-%d')
@@ -274,15 +308,17 @@ class TestAPIPermissions:
         # Create multiple patients for pagination testing
         with app.app_context():
             from models import db
-            for i in range(25):  # Create more than default page size
-                patient = Patient(
-                    patient_id=f'P{i:03d}',
-                    first_name=f'Patient{i}',
-                    last_name='Test',
-                    phone=f'+123456789{i:02d}',
-                    email=f'patient{i}@test.com'
-                )
-                db.session.add(patient)
+            rows = [
+                {
+                    'patient_id': f'PAGE{i:03d}',
+                    'first_name': f'Patient{i}',
+                    'last_name': 'Test',
+                    'phone': f'+123456789{i:02d}',
+                    'email': f'patient{i}@test.com'
+                }
+                for i in range(25)  # Create more than default page size
+            ]
+            db.session.bulk_insert_mappings(Patient, rows)
             db.session.commit()
         
         # Test first page
@@ -44,9 +44,10 @@ class TestAuthentication:
         assert response.status_code == 200
         assert b'Invalid username or password' in response.data or b'Login' in response.data
     
-    def test_logout(self, authenticated_client):
+    def test_logout(self, client, auth, test_user):
         """Test user logout"""
-        response = authenticated_client.get('/logout', follow_redirects=True)
+        auth.login()
+        response = client.get('/logout', follow_redirects=True)
         assert response.status_code == 200
         # Should redirect to login page after logout
         assert b'Login' in response.data
@@ -173,6 +174,7 @@ class TestRoleBasedAccess:
             response = client.get('/dashboard')
             assert response.status_code == 200
 
+@pytest.mark.real_password_hashing
 class TestPasswordSecurity:
     """Test password security features"""
     
@@ -190,6 +192,7 @@ class TestPasswordSecurity:
             
             # Password should be hashed, not stored in plain text
             assert user.password_hash != 'mypassword'
+            assert 'mypassword' not in user.password_hash
             assert user.check_password('mypassword')
             assert not user.check_password('wrongpassword')
     
@@ -224,15 +227,16 @@ class TestSessionManagement:
         response = authenticated_client.get('/dashboard')
         assert response.status_code == 200
     
-    def test_session_cleanup_on_logout(self, authenticated_client):
+    def test_session_cleanup_on_logout(self, client, auth, test_user):
         """Test that session is cleaned up on logout"""
         # Verify authenticated access
-        response = authenticated_client.get('/dashboard')
+        auth.login()
+        response = client.get('/dashboard')
         assert response.status_code == 200
         
         # Logout
-        authenticated_client.get('/logout')
+        auth.logout()
         
         # Should no longer have access
-        response = authenticated_client.get('/dashboard')
+        response = client.get('/dashboard')
         assert response.status_code == 302  # Redirect to login
@@ -2,6 +2,7 @@
 
 import pytest
 from datetime import date, time, datetime
+from sqlalchemy import select
 from models import (
     User, Patient, Appointment, Visit, Billing, Payment, 
     Prescription, PrescriptionMedication, TreatmentPackage, PatientPackage,
@@ -11,93 +12,88 @@ from models import (
 class TestUser:
     """Test User model"""
     
-    def test_create_user(self, app):
+    def test_create_user(self):
         """Test user creation"""
-        with app.app_context():
-            user = User(
-                username='testuser',
-                email='test@example.com',
-                first_name='Test',
-                last_name='User',
-                role=UserRole.DOCTOR
-            )
-            user.set_password('password123')
-            
-            assert user.username == 'testuser'
-            assert user.email == 'test@example.com'
-            assert user.full_name == 'Test User'
-            assert user.role == UserRole.DOCTOR
-            assert user.check_password('password123')
-            assert not user.check_password('wrongpassword')
+        user = User(
+            username='testuser',
+            email='test@example.com',
+            first_name='Test',
+            last_name='User',
+            role=UserRole.DOCTOR
+        )
+        user.set_password('password123')
+        
+        assert user.username == 'testuser'
+        assert user.email == 'test@example.com'
+        assert user.full_name == 'Test User'
+        assert user.role == UserRole.DOCTOR
+        assert user.check_password('password123')
+        assert not user.check_password('wrongpassword')
     
-    def test_user_roles(self, app):
+    def test_user_roles(self):
         """Test user role functionality"""
-        with app.app_context():
-            admin = User(username='admin', email='admin@test.com', 
-                        first_name='Admin', last_name='User', role=UserRole.ADMIN)
-            doctor = User(username='doctor', email='doctor@test.com',
-                         first_name='Doctor', last_name='User', role=UserRole.DOCTOR)
-            
-            assert admin.has_role(UserRole.ADMIN)
-            assert not admin.has_role(UserRole.DOCTOR)
-            assert doctor.has_role(UserRole.DOCTOR)
-            assert not doctor.has_role(UserRole.ADMIN)
+        admin = User(username='admin', email='admin@test.com', 
+                    first_name='Admin', last_name='User', role=UserRole.ADMIN)
+        doctor = User(username='doctor', email='doctor@test.com',
+                     first_name='Doctor', last_name='User', role=UserRole.DOCTOR)
+        
+        assert admin.has_role(UserRole.ADMIN)
+        assert not admin.has_role(UserRole.DOCTOR)
+        assert doctor.has_role(UserRole.DOCTOR)
+        assert not doctor.has_role(UserRole.ADMIN)
     
-    def test_user_permissions(self, app):
+    def test_user_permissions(self):
         """Test user permission system"""
-        with app.app_context():
-            admin = User(username='admin', email='admin@test.com',
-                        first_name='Admin', last_name='User', role=UserRole.ADMIN)
-            staff = User(username='staff', email='staff@test.com',
-                        first_name='Staff', last_name='User', role=UserRole.STAFF)
-            patient = User(username='patient', email='patient@test.com',
-                          first_name='Patient', last_name='User', role=UserRole.PATIENT)
-            
-            assert admin.can_access('patients')
-            assert admin.can_access('billing')
-            assert staff.can_access('patients')
-            assert staff.can_access('billing')
-            assert not patient.can_access('billing')
-            assert patient.can_access('own_data')
+        admin = User(username='admin', email='admin@test.com',
+                    first_name='Admin', last_name='User', role=UserRole.ADMIN)
+        staff = User(username='staff', email='staff@test.com',
+                    first_name='Staff', last_name='User', role=UserRole.STAFF)
+        patient = User(username='patient', email='patient@test.com',
+                      first_name='Patient', last_name='User', role=UserRole.PATIENT)
+        
+        assert admin.can_access('patients')
+        assert admin.can_access('billing')
+        assert staff.can_access('patients')
+        assert staff.can_access('billing')
+        assert not patient.can_access('billing')
+        assert patient.can_access('own_data')
 
 class TestPatient:
     """Test Patient model"""
     
-    def test_create_patient(self, app):
+    def test_create_patient(self):
         """Test patient creation"""
-        with app.app_context():
-            patient = Patient(
-                patient_id='P001',
-                first_name='John',
-                last_name='Doe',
-                email='john@example.com',
-                phone='+1234567890',
-                date_of_birth=date(1990, 1, 1),
-                gender='Male',
-                address='123 Main St',
-                city='Test City'
-            )
-            
-            assert patient.patient_id == 'P001'
-            assert patient.full_name == 'John Doe'
-            assert patient.age == date.today().year - 1990
+        patient = Patient(
+            patient_id='P001',
+            first_name='John',
+            last_name='Doe',
+            email='john@example.com',
+            phone='+1234567890',
+            date_of_birth=date(1990, 1, 1),
+            gender='Male',
+            address='123 Main St',
+            city='Test City'
+        )
+        
+        assert patient.patient_id == 'P001'
+        assert patient.full_name == 'John Doe'
+        assert patient.age == date.today().year - 1990
     
-    def test_patient_age_calculation(self, app):
+    def test_patient_age_calculation(self):
         """Test patient age calculation"""
-        with app.app_context():
-            # Patient born in 1990
-            patient = Patient(
-                patient_id='P002',
-                first_name='Jane',
-                last_name='Doe',
-                date_of_birth=date(1990, 6, 15)
-            )
-            
-            expected_age = date.today().year - 1990
-            if date.today() < date(date.today().year, 6, 15):
-                expected_age -= 1
-            
-            assert patient.age == expected_age
+        # Patient born in 1990
+        patient = Patient(
+            patient_id='P002',
+            first_name='Jane',
+            last_name='Doe',
+            date_of_birth=date(1990, 6, 15)
+        )
+        
+        expected_age = date.today().year - 1990
+        if date.today() < date(date.today().year, 6, 15):
+            expected_age -= 1
+        
+        assert patient.age == expected_age
 
 class TestAppointment:
     """Test Appointment model"""
@@ -126,20 +122,22 @@ class TestBilling:
     def test_create_billing(self, app, test_patient, test_doctor):
         """Test billing creation"""
         with app.app_context():
-            # Create a visit first
-            visit = Visit(
-                patient_id=test_patient.id,
-                doctor_id=test_doctor.id,
-                visit_type=VisitType.CLINIC,
-                date_of_visit=date.today(),
-                diagnosis='Test diagnosis'
-            )
             from models import db
-            db.session.add(visit)
-            db.session.flush()
+            
+            # Create a visit first (bulk insert skips unit-of-work bookkeeping)
+            db.session.bulk_insert_mappings(Visit, [{
+                'patient_id': test_patient.id,
+                'doctor_id': test_doctor.id,
+                'visit_type': VisitType.CLINIC,
+                'date_of_visit': date.today(),
+                'diagnosis': 'Test diagnosis'
+            }])
+            visit_id = db.session.execute(
+                select(Visit.id).order_by(Visit.id.desc()).limit(1)
+            ).scalar()
             
             billing = Billing(
-                visit_id=visit.id,
+                visit_id=visit_id,
                 bill_number='BILL001',
                 subtotal=500.0,
                 discount_amount=50.0,
@@ -206,24 +204,29 @@ class TestTreatmentPackage:
             from models import db
             
             # Create package
-            package = TreatmentPackage(
-                name='Premium Package',
-                total_sessions=20,
-                price_per_session=600.0,
-                total_price=10800.0,
-                validity_days=120
-            )
-            db.session.add(package)
-            db.session.flush()
+            db.session.bulk_insert_mappings(TreatmentPackage, [{
+                'name': 'Premium Package',
+                'total_sessions': 20,
+                'price_per_session': 600.0,
+                'total_price': 10800.0,
+                'validity_days': 120
+            }])
+            package_id = db.session.execute(
+                select(TreatmentPackage.id).order_by(TreatmentPackage.id.desc()).limit(1)
+            ).scalar()
             
             # Create patient package
-            patient_package = PatientPackage(
-                patient_id=test_patient.id,
-                package_id=package.id,
-                sessions_remaining=20,
-                start_date=date.today(),
-                expiry_date=date.today()
-            )
+            db.session.bulk_insert_mappings(PatientPackage, [{
+                'patient_id': test_patient.id,
+                'package_id': package_id,
+                'sessions_remaining': 20,
+                'start_date': date.today(),
+                'expiry_date': date.today()
+            }])
+            patient_package = db.session.execute(
+                select(PatientPackage).order_by(PatientPackage.id.desc()).limit(1)
+            ).scalar()
             
+            assert patient_package.package_id == package_id
             assert patient_package.sessions_remaining == 20
             assert patient_package.is_active == True
@@ -1,12 +1,82 @@
 # tests/test_performance.py - Performance Tests
 
 import pytest
+import asyncio
 import time
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import date, timedelta
-from models import db, Patient, Appointment, User, UserRole
+import httpx
+from contextlib import contextmanager
+from datetime import date, timedelta, time as dt_time
+from flask_login import login_user
+from sqlalchemy import event, insert
+from models import db, Patient, Appointment, User, UserRole, VisitType
+from routes.api import api_get_patients, api_search
 
+class _InlineWSGITransport(httpx.AsyncBaseTransport):
+    """Serve AsyncClient requests from the WSGI app on the event loop thread.
+
+    httpx.WSGITransport only speaks the sync transport API, so wrap it and
+    buffer each body. Gathered requests are multiplexed on one thread: every
+    request shares the per-test connection from db_transaction, and its
+    SAVEPOINTs must not interleave with another request's.
+    """
+    
+    def __init__(self, app):
+        self._transport = httpx.WSGITransport(app=app)
+    
+    async def handle_async_request(self, request):
+        await request.aread()
+        response = self._transport.handle_request(request)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            content=response.read()
+        )
+
+@contextmanager
+def count_queries(app):
+    """Collect the SQL statements executed inside the block.
+
+    Savepoint bookkeeping from the per-test transaction is not counted.
+    """
+    with app.app_context():
+        bind = db.engines[None]  # the per-test connection from db_transaction
+    queries = []
+    
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith(('SAVEPOINT', 'RELEASE', 'ROLLBACK')):
+            queries.append(statement)
+    
+    event.listen(bind, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(bind, 'before_cursor_execute', before_cursor_execute)
+
+def _async_client(app, authenticated_client=None):
+    """AsyncClient bound to the app, optionally sharing the test session."""
+    cookies = None
+    if authenticated_client is not None:
+        name = app.config['SESSION_COOKIE_NAME']
+        cookies = {name: authenticated_client.get_cookie(name).value}
+    return httpx.AsyncClient(
+        transport=_InlineWSGITransport(app),
+        base_url='http://test',
+        cookies=cookies
+    )
+
+WARM_URLS = ('/api/patients', '/api/search?q=x', '/api/dashboard/stats', '/health')
+
+@pytest.fixture(scope='module', autouse=True)
+def _warm_views(app, test_user):
+    """Hit each timed endpoint once so cold SQL compilation isn't measured."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(test_user.id)
+        session['_fresh'] = True
+    for url in WARM_URLS:
+        client.get(url).close()
+
+@pytest.mark.xdist_group('db')
 class TestPerformance:
     """Test application performance under various loads"""
     
@@ -15,24 +85,23 @@ class TestPerformance:
         
         # Create a large number of patients
         with app.app_context():
-            patients = []
-            for i in range(100):  # Create 100 patients
-                patient = Patient(
-                    patient_id=f'PERF{i:03d}',
-                    first_name=f'Patient{i}',
-                    last_name='Performance',
-                    phone=f'+123456{i:04d}',
-                    email=f'perf{i}@test.com'
-                )
-                patients.append(patient)
-            
-            db.session.add_all(patients)
+            rows = [
+                {
+                    'patient_id': f'PERF{i:03d}',
+                    'first_name': f'Patient{i}',
+                    'last_name': 'Performance',
+                    'phone': f'+123456{i:04d}',
+                    'email': f'perf{i}@test.com'
+                }
+                for i in range(100)  # Create 100 patients
+            ]
+            db.session.bulk_insert_mappings(Patient, rows)
             db.session.commit()
         
         # Measure response time
-        start_time = time.time()
+        start_time = time.perf_counter()
         response = authenticated_client.get('/api/patients')
-        end_time = time.time()
+        end_time = time.perf_counter()
         
         response_time = end_time - start_time
         
@@ -40,95 +109,151 @@ class TestPerformance:
         assert response_time < 2.0  # Should respond within 2 seconds
         
         # Test pagination performance
-        start_time = time.time()
-        response = authenticated_client.get('/api/patients?page=1&per_page=20')
-        end_time = time.time()
+        with count_queries(app) as queries:
+            start_time = time.perf_counter()
+            response = authenticated_client.get('/api/patients?page=1&per_page=20')
+            end_time = time.perf_counter()
         
         pagination_time = end_time - start_time
         assert response.status_code == 200
         assert pagination_time < 1.0  # Pagination should be faster
+        # User load, page and count; anything more is an N+1
+        assert len(queries) <= 3
     
     def test_search_performance(self, app, authenticated_client):
         """Test search performance with large dataset"""
         
         # Create patients with searchable data
         with app.app_context():
-            patients = []
-            for i in range(200):
-                patient = Patient(
-                    patient_id=f'SEARCH{i:03d}',
-                    first_name=f'SearchPatient{i}',
-                    last_name=f'TestLast{i}',
-                    phone=f'+987654{i:04d}',
-                    email=f'search{i}@test.com'
-                )
-                patients.append(patient)
-            
-            db.session.add_all(patients)
+            rows = [
+                {
+                    'patient_id': f'SEARCH{i:03d}',
+                    'first_name': f'SearchPatient{i}',
+                    'last_name': f'TestLast{i}',
+                    'phone': f'+987654{i:04d}',
+                    'email': f'search{i}@test.com'
+                }
+                for i in range(200)
+            ]
+            db.session.bulk_insert_mappings(Patient, rows)
             db.session.commit()
         
         # Test search performance
         search_terms = ['SearchPatient1', 'TestLast5', '+987654']
         
         for term in search_terms:
-            start_time = time.time()
-            response = authenticated_client.get(f'/api/search?q={term}')
-            end_time = time.time()
+            with count_queries(app) as queries:
+                start_time = time.perf_counter()
+                response = authenticated_client.get(f'/api/search?q={term}')
+                end_time = time.perf_counter()
             
             search_time = end_time - start_time
             
             assert response.status_code == 200
             assert search_time < 1.0  # Search should be fast
+            # User load, patients and appointments
+            assert len(queries) <= 3
+    
+    def test_patient_list_view_performance(self, app, test_user):
+        """Time the patient list view itself, without the test client"""
+        
+        with app.app_context():
+            rows = [
+                {
+                    'patient_id': f'VIEW{i:03d}',
+                    'first_name': f'ViewPatient{i}',
+                    'last_name': 'Performance',
+                    'phone': f'+444555{i:04d}',
+                    'email': f'view{i}@test.com'
+                }
+                for i in range(100)
+            ]
+            db.session.bulk_insert_mappings(Patient, rows)
+            db.session.commit()
+        
+        with app.test_request_context('/api/patients?per_page=20'):
+            login_user(db.session.get(User, test_user.id))
+            
+            start_time = time.perf_counter()
+            response = api_get_patients()
+            view_time = time.perf_counter() - start_time
+        
+        assert response.status_code == 200
+        assert view_time < 0.3  # No WSGI or test-client overhead here
     
-    def test_concurrent_requests(self, authenticated_client):
+    def test_search_view_performance(self, app, test_user):
+        """Time the search view itself, without the test client"""
+        
+        with app.app_context():
+            rows = [
+                {
+                    'patient_id': f'VSRCH{i:03d}',
+                    'first_name': f'ViewSearch{i}',
+                    'last_name': f'ViewLast{i}',
+                    'phone': f'+666777{i:04d}',
+                    'email': f'vsearch{i}@test.com'
+                }
+                for i in range(200)
+            ]
+            db.session.bulk_insert_mappings(Patient, rows)
+            db.session.commit()
+        
+        with app.test_request_context('/api/search?q=ViewSearch1'):
+            login_user(db.session.get(User, test_user.id))
+            
+            start_time = time.perf_counter()
+            response = api_search()
+            search_time = time.perf_counter() - start_time
+        
+        assert response.status_code == 200
+        assert search_time < 0.2
+    
+    def test_concurrent_requests(self, app, authenticated_client):
         """Test handling of concurrent requests"""
         
-        def make_request():
-            """Make a single request"""
-            response = authenticated_client.get('/api/dashboard/stats')
-            return response.status_code == 200
+        async def make_requests(num_requests):
+            """Issue the requests together from one event loop"""
+            async with _async_client(app, authenticated_client) as client:
+                responses = await asyncio.gather(
+                    *[client.get('/api/dashboard/stats') for _ in range(num_requests)]
+                )
+            return [response.status_code == 200 for response in responses]
         
         # Test with multiple concurrent requests
-        num_threads = 10
-        with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            futures = [executor.submit(make_request) for _ in range(num_threads)]
-            
-            results = []
-            for future in as_completed(futures):
-                results.append(future.result())
+        num_requests = 10
+        results = asyncio.run(make_requests(num_requests))
         
         # All requests should succeed
         assert all(results)
-        assert len(results) == num_threads
+        assert len(results) == num_requests
     
     def test_database_query_performance(self, app):
         """Test database query performance"""
         
         with app.app_context():
             # Create test data
-            patients = []
-            for i in range(50):
-                patient = Patient(
-                    patient_id=f'DBPERF{i:03d}',
-                    first_name=f'DBPatient{i}',
-                    last_name='Performance',
-                    phone=f'+111222{i:04d}',
-                    email=f'dbperf{i}@test.com'
-                )
-                patients.append(patient)
-            
-            db.session.add_all(patients)
+            rows = [
+                {
+                    'patient_id': f'DBPERF{i:03d}',
+                    'first_name': f'DBPatient{i}',
+                    'last_name': 'Performance',
+                    'phone': f'+111222{i:04d}',
+                    'email': f'dbperf{i}@test.com'
+                }
+                for i in range(50)
+            ]
+            db.session.bulk_insert_mappings(Patient, rows)
             db.session.commit()
             
             # Test query performance
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             # Complex query with joins and filters
             results = db.session.query(Patient).filter(
                 Patient.first_name.like('DBPatient%')
             ).order_by(Patient.created_at.desc()).limit(20).all()
             
-            end_time = time.time()
+            end_time = time.perf_counter()
             query_time = end_time - start_time
             
             assert len(results) > 0
@@ -138,42 +263,48 @@ class TestPerformance:
         """Test appointment creation performance"""
         
         with app.app_context():
-            appointments = []
-            start_time = time.time()
-            
-            # Create multiple appointments
-            for i in range(20):
-                appointment = Appointment(
-                    patient_id=test_patient.id,
-                    doctor_id=test_doctor.id,
-                    appointment_date=date.today() + timedelta(days=i),
-                    appointment_time=time(10, 0),
-                    visit_type='clinic',
-                    reason=f'Performance test appointment {i}'
-                )
-                appointments.append(appointment)
+            today = date.today()
+            start_time = time.perf_counter()
             
-            db.session.add_all(appointments)
+            # Create multiple appointments in one executemany
+            rows = [
+                {
+                    'patient_id': test_patient.id,
+                    'doctor_id': test_doctor.id,
+                    'appointment_date': today + timedelta(days=i),
+                    'appointment_time': dt_time(10, 0),
+                    'visit_type': VisitType.CLINIC,
+                    'reason': f'Performance test appointment {i}'
+                }
+                for i in range(20)
+            ]
+            db.session.execute(Appointment.__table__.insert(), rows)
             db.session.commit()
             
-            end_time = time.time()
+            end_time = time.perf_counter()
             creation_time = end_time - start_time
             
-            assert creation_time < 2.0  # Should create 20 appointments quickly
+            assert creation_time < 0.2  # Should create 20 appointments quickly
     
     def test_memory_usage(self, app, authenticated_client):
         """Test memory usage during operations"""
+        import gc
         import psutil
         import os
         
         process = psutil.Process(os.getpid())
+        gc.collect()
+        gc.collect()  # Second pass flushes objects freed by finalizers
         initial_memory = process.memory_info().rss / 1024 / 1024  # MB
         
         # Perform memory-intensive operations
         for _ in range(10):
             response = authenticated_client.get('/api/patients')
             assert response.status_code == 200
+            response.close()  # Release the buffered body right away
         
+        gc.collect()
+        gc.collect()
         final_memory = process.memory_info().rss / 1024 / 1024  # MB
         memory_increase = final_memory - initial_memory
         
@@ -183,26 +314,30 @@ class TestPerformance:
 class TestLoadTesting:
     """Load testing scenarios"""
     
-    def test_sustained_load(self, authenticated_client):
+    def test_sustained_load(self, app):
         """Test application under sustained load"""
         
-        def sustained_requests():
+        async def sustained_requests():
             """Make sustained requests"""
             success_count = 0
-            for _ in range(20):
-                try:
-                    response = authenticated_client.get('/health')
-                    if response.status_code == 200:
-                        success_count += 1
-                    time.sleep(0.1)  # Small delay between requests
-                except Exception:
-                    pass
+            deadline = time.monotonic()
+            async with _async_client(app) as client:
+                for _ in range(20):
+                    # Evenly spaced slots; a slow request eats into its own slot
+                    deadline += 0.05
+                    try:
+                        response = await client.get('/health')
+                        if response.status_code == 200:
+                            success_count += 1
+                    except Exception:
+                        pass
+                    await asyncio.sleep(max(0, deadline - time.monotonic()))
             return success_count
         
         # Run sustained load test
-        start_time = time.time()
-        success_count = sustained_requests()
-        end_time = time.time()
+        start_time = time.perf_counter()
+        success_count = asyncio.run(sustained_requests())
+        end_time = time.perf_counter()
         
         total_time = end_time - start_time
         
@@ -210,26 +345,26 @@ class TestLoadTesting:
         assert success_count >= 18  # Allow for some failures
         assert total_time < 10  # Should complete within reasonable time
     
-    def test_burst_load(self, authenticated_client):
+    def test_burst_load(self, app):
         """Test application under burst load"""
         
-        def burst_request():
-            """Single burst request"""
-            try:
-                response = authenticated_client.get('/health')
-                return response.status_code == 200
-            except Exception:
-                return False
+        async def burst_requests(num_requests):
+            """Fire the whole burst at once"""
+            async with _async_client(app) as client:
+                responses = await asyncio.gather(
+                    *[client.get('/health') for _ in range(num_requests)],
+                    return_exceptions=True
+                )
+            return [
+                not isinstance(response, Exception) and response.status_code == 200
+                for response in responses
+            ]
         
         # Create burst of concurrent requests
         num_requests = 20
-        start_time = time.time()
-        
-        with ThreadPoolExecutor(max_workers=num_requests) as executor:
-            futures = [executor.submit(burst_request) for _ in range(num_requests)]
-            results = [future.result() for future in as_completed(futures)]
-        
-        end_time = time.time()
+        start_time = time.perf_counter()
+        results = asyncio.run(burst_requests(num_requests))
+        end_time = time.perf_counter()
         burst_time = end_time - start_time
         
         success_rate = sum(results) / len(results)
@@ -244,24 +379,25 @@ class TestCaching:
     def test_repeated_requests_performance(self, authenticated_client):
         """Test that repeated requests benefit from caching"""
         
-        # First request (cache miss)
-        start_time = time.time()
+        # Warm the view so statement compilation isn't counted as a miss
+        authenticated_client.get('/api/dashboard/stats')
+        
+        # First request returns the stats and an ETag
         response1 = authenticated_client.get('/api/dashboard/stats')
-        first_request_time = time.time() - start_time
         
         assert response1.status_code == 200
+        assert 'ETag' in response1.headers
         
-        # Second request (should be faster due to caching)
-        start_time = time.time()
-        response2 = authenticated_client.get('/api/dashboard/stats')
-        second_request_time = time.time() - start_time
-        
-        assert response2.status_code == 200
+        # Second request revalidates and gets 304 without a body
+        response2 = authenticated_client.get(
+            '/api/dashboard/stats',
+            headers={'If-None-Match': response1.headers['ETag']}
+        )
         
-        # Second request should be faster (or at least not significantly slower)
-        # Allow some variance due to system load
-        assert second_request_time <= first_request_time * 1.5
+        assert response2.status_code == 304
+        assert response2.data == b''
 
+@pytest.mark.xdist_group('db')
 class TestScalability:
     """Test application scalability"""
     
@@ -269,38 +405,37 @@ class TestScalability:
         """Test handling of large datasets"""
         
         with app.app_context():
-            # Create a large dataset
-            patients = []
-            batch_size = 100
-            
-            for batch in range(5):  # 5 batches of 100 = 500 patients
-                batch_patients = []
-                for i in range(batch_size):
-                    patient_id = batch * batch_size + i
-                    patient = Patient(
-                        patient_id=f'SCALE{patient_id:04d}',
-                        first_name=f'ScalePatient{patient_id}',
-                        last_name='Scalability',
-                        phone=f'+555000{patient_id:04d}',
-                        email=f'scale{patient_id}@test.com'
-                    )
-                    batch_patients.append(patient)
-                
-                db.session.add_all(batch_patients)
-                db.session.commit()  # Commit in batches
+            # Create a large dataset (500 patients) in one statement;
+            # bound str.__mod__ formatters skip per-row f-string setup
+            fmt_id = 'SCALE%04d'.__mod__
+            fmt_name = 'ScalePatient%d'.__mod__
+            fmt_phone = '+555000%04d'.__mod__
+            fmt_email = 'scale%d@test.com'.__mod__
+            rows = [
+                {
+                    'patient_id': fmt_id(patient_id),
+                    'first_name': fmt_name(patient_id),
+                    'last_name': 'Scalability',
+                    'phone': fmt_phone(patient_id),
+                    'email': fmt_email(patient_id)
+                }
+                for patient_id in range(500)
+            ]
+            db.session.execute(insert(Patient), rows)
+            db.session.commit()
         
         # Test querying large dataset
-        start_time = time.time()
+        start_time = time.perf_counter()
         response = authenticated_client.get('/api/patients?per_page=50')
-        query_time = time.time() - start_time
+        query_time = time.perf_counter() - start_time
         
         assert response.status_code == 200
         assert query_time < 3.0  # Should handle large dataset reasonably
         
         # Test search on large dataset
-        start_time = time.time()
+        start_time = time.perf_counter()
         response = authenticated_client.get('/api/search?q=ScalePatient')
-        search_time = time.time() - start_time
+        search_time = time.perf_counter() - start_time
         
         assert response.status_code == 200
         assert search_time < 2.0  # Search should still be fast
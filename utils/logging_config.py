@@ -1,11 +1,43 @@
 # utils/logging_config.py - Advanced Logging Configuration
 
 import os
+import re
+import time
+import atexit
+import queue
 import logging
 import logging.handlers
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 import json
+from flask import g, request as flask_request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from flask_login import current_user
+except ImportError:
+    current_user = None
+
+
+def _dumps(data):
+    """Serialize a log entry with orjson when installed, else compact stdlib json"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str).decode()
+    return json.dumps(data, separators=(',', ':'), default=str)
+
+# getpid() once per process instead of once per record; refreshed in forked workers
+_PID = os.getpid()
+
+def _refresh_pid():
+    global _PID
+    _PID = os.getpid()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_refresh_pid)
 
 class JSONFormatter(logging.Formatter):
     """Custom JSON formatter for structured logging"""
@@ -13,14 +45,15 @@ class JSONFormatter(logging.Formatter):
     def format(self, record):
         """Format log record as JSON"""
         log_entry = {
-            'timestamp': datetime.utcnow().isoformat(),
+            # record.created is already captured by logging; no second clock read
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             'level': record.levelname,
             'logger': record.name,
             'message': record.getMessage(),
             'module': record.module,
             'function': record.funcName,
             'line': record.lineno,
-            'process_id': os.getpid(),
+            'process_id': _PID,
             'thread_id': record.thread,
         }
         
@@ -41,7 +74,7 @@ class JSONFormatter(logging.Formatter):
         if hasattr(record, 'user_agent'):
             log_entry['user_agent'] = record.user_agent
         
-        return json.dumps(log_entry)
+        return _dumps(log_entry)
 
 class SecurityFilter(logging.Filter):
     """Filter to prevent logging of sensitive information"""
@@ -51,18 +84,85 @@ class SecurityFilter(logging.Filter):
         'credit_card', 'ssn', 'social_security'
     ]
     
+    # All patterns in one case-insensitive scan instead of a loop of substring checks
+    _PATTERN = re.compile('|'.join(map(re.escape, SENSITIVE_PATTERNS)), re.IGNORECASE)
+    
     def filter(self, record):
-        """Filter out sensitive information"""
-        message = record.getMessage().lower()
+        """Filter out sensitive information
+        
+        Scans the format template first; only records with arguments are
+        formatted, and the result is kept on the record so the handler does
+        not format it a second time.
+        """
+        template = record.msg if isinstance(record.msg, str) else str(record.msg)
+        sensitive = self._PATTERN.search(template)
         
-        for pattern in self.SENSITIVE_PATTERNS:
-            if pattern in message:
-                record.msg = "[SENSITIVE DATA FILTERED]"
-                record.args = ()
-                break
+        if not sensitive and record.args:
+            # Dict keys, exceptions and objects only show up once formatted
+            message = record.getMessage()
+            sensitive = self._PATTERN.search(message)
+            record.msg = message
+            record.args = ()
+        
+        if sensitive:
+            record.msg = "[SENSITIVE DATA FILTERED]"
+            record.args = ()
         
         return True
 
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that only merges msg and args on the calling thread
+    
+    The stock prepare() copies and fully formats the record so it can be
+    pickled; this queue never leaves the process, so the listener still does
+    the formatting. The message itself is merged here, so args are captured
+    as they were at the log call and their __str__ runs inside the caller's
+    request and app context. exc_info is kept for the listener's formatter.
+    """
+    
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# Background listeners started by setup_logging, stopped on exit or re-setup
+_listeners = []
+
+def _stop_listeners():
+    """Flush and stop all queue listeners"""
+    while _listeners:
+        _listeners.pop().stop()
+
+atexit.register(_stop_listeners)
+
+def _attach_queue(logger, *handlers):
+    """Route a logger's records through a queue to handlers on a background thread"""
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    
+    for handler in list(logger.handlers):
+        if isinstance(handler, _InProcessQueueHandler):
+            logger.removeHandler(handler)
+    logger.addHandler(_InProcessQueueHandler(log_queue))
+
+def _make_handler(path, backup_count, rotation='external'):
+    """File handler for a log file
+    
+    With external rotation (logrotate), a WatchedFileHandler just reopens the
+    file when it has been moved, so there is no per-record size check and no
+    rename race between gunicorn workers. 'builtin' keeps the in-process
+    RotatingFileHandler for hosts without logrotate.
+    """
+    if rotation == 'builtin':
+        return logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=10 * 1024 * 1024,  # 10MB
+            backupCount=backup_count
+        )
+    return logging.handlers.WatchedFileHandler(path)
+
 def setup_logging(app):
     """Setup comprehensive logging for the application"""
     
@@ -76,6 +176,12 @@ def setup_logging(app):
     
     # Clear existing handlers
     root_logger.handlers.clear()
+    _stop_listeners()
+    
+    rotation = app.config.get('LOG_ROTATION', 'external')
+    
+    # File writes and rotation happen on listener threads, not request threads
+    root_handlers = []
     
     # Console handler
     if app.config.get('LOG_TO_STDOUT', False):
@@ -91,113 +197,106 @@ def setup_logging(app):
             console_handler.setFormatter(console_formatter)
         
         console_handler.addFilter(SecurityFilter())
-        root_logger.addHandler(console_handler)
+        root_handlers.append(console_handler)
     
     # File handlers
     if not app.config.get('LOG_TO_STDOUT', False):
         # Application log file
         app_log_file = log_dir / 'app.log'
-        app_handler = logging.handlers.RotatingFileHandler(
-            app_log_file,
-            maxBytes=10 * 1024 * 1024,  # 10MB
-            backupCount=5
-        )
+        app_handler = _make_handler(app_log_file, 5, rotation)
         app_handler.setLevel(logging.INFO)
         app_handler.setFormatter(JSONFormatter())
         app_handler.addFilter(SecurityFilter())
-        root_logger.addHandler(app_handler)
+        root_handlers.append(app_handler)
         
         # Error log file
         error_log_file = log_dir / 'error.log'
-        error_handler = logging.handlers.RotatingFileHandler(
-            error_log_file,
-            maxBytes=10 * 1024 * 1024,  # 10MB
-            backupCount=5
-        )
+        error_handler = _make_handler(error_log_file, 5, rotation)
         error_handler.setLevel(logging.ERROR)
         error_handler.setFormatter(JSONFormatter())
         error_handler.addFilter(SecurityFilter())
-        root_logger.addHandler(error_handler)
+        root_handlers.append(error_handler)
         
         # Access log file
         access_log_file = log_dir / 'access.log'
-        access_handler = logging.handlers.RotatingFileHandler(
-            access_log_file,
-            maxBytes=10 * 1024 * 1024,  # 10MB
-            backupCount=10
-        )
+        access_handler = _make_handler(access_log_file, 10, rotation)
         access_handler.setLevel(logging.INFO)
         access_handler.setFormatter(JSONFormatter())
         
         # Create access logger
         access_logger = logging.getLogger('access')
-        access_logger.addHandler(access_handler)
+        _attach_queue(access_logger, access_handler)
         access_logger.setLevel(logging.INFO)
         access_logger.propagate = False
     
     # Security log file
     security_log_file = log_dir / 'security.log'
-    security_handler = logging.handlers.RotatingFileHandler(
-        security_log_file,
-        maxBytes=10 * 1024 * 1024,  # 10MB
-        backupCount=10
-    )
+    security_handler = _make_handler(security_log_file, 10, rotation)
     security_handler.setLevel(logging.WARNING)
     security_handler.setFormatter(JSONFormatter())
     
     # Create security logger
     security_logger = logging.getLogger('security')
-    security_logger.addHandler(security_handler)
+    _attach_queue(security_logger, security_handler)
     security_logger.setLevel(logging.WARNING)
     security_logger.propagate = False
     
     # Performance log file
     performance_log_file = log_dir / 'performance.log'
-    performance_handler = logging.handlers.RotatingFileHandler(
-        performance_log_file,
-        maxBytes=10 * 1024 * 1024,  # 10MB
-        backupCount=5
-    )
+    performance_handler = _make_handler(performance_log_file, 5, rotation)
     performance_handler.setLevel(logging.INFO)
     performance_handler.setFormatter(JSONFormatter())
     
     # Create performance logger
     performance_logger = logging.getLogger('performance')
-    performance_logger.addHandler(performance_handler)
+    _attach_queue(performance_logger, performance_handler)
     performance_logger.setLevel(logging.INFO)
     performance_logger.propagate = False
     
+    _attach_queue(root_logger, *root_handlers)
+    
     # Set specific logger levels
     logging.getLogger('werkzeug').setLevel(logging.WARNING)
     logging.getLogger('urllib3').setLevel(logging.WARNING)
     
     app.logger.info("Logging system initialized")
 
+# Named loggers looked up once; logging.getLogger takes a lock per call
+_ACCESS_LOG = logging.getLogger('access')
+_SECURITY_LOG = logging.getLogger('security')
+_PERFORMANCE_LOG = logging.getLogger('performance')
+_BUSINESS_LOG = logging.getLogger('business')
+
+_SEVERITY_LEVELS = {'CRITICAL': logging.CRITICAL, 'ERROR': logging.ERROR}
+
 def log_request(request, response, duration):
     """Log HTTP request details"""
-    access_logger = logging.getLogger('access')
+    if not _ACCESS_LOG.isEnabledFor(logging.INFO):
+        return
     
     log_data = {
         'method': request.method,
         'url': request.url,
         'status_code': response.status_code,
-        'duration_ms': round(duration * 1000, 2),
+        'duration_ms': duration * 1000.0,
         'ip_address': request.remote_addr,
-        'user_agent': request.headers.get('User-Agent', ''),
+        # Straight from the WSGI environ, skipping the case-insensitive header lookup
+        'user_agent': request.environ.get('HTTP_USER_AGENT', ''),
         'content_length': response.content_length or 0
     }
     
     # Add user info if available
-    from flask_login import current_user
-    if current_user and current_user.is_authenticated:
+    if current_user is not None and current_user.is_authenticated:
         log_data['user_id'] = current_user.id
         log_data['username'] = current_user.username
     
-    access_logger.info("HTTP Request", extra=log_data)
+    _ACCESS_LOG.info("HTTP Request", extra=log_data)
 
 def log_security_event(event_type, details, severity='WARNING'):
     """Log security-related events"""
-    security_logger = logging.getLogger('security')
+    level = _SEVERITY_LEVELS.get(severity, logging.WARNING)
+    if not _SECURITY_LOG.isEnabledFor(level):
+        return
     
     log_data = {
         'event_type': event_type,
@@ -205,16 +304,12 @@ def log_security_event(event_type, details, severity='WARNING'):
         'severity': severity
     }
     
-    if severity == 'CRITICAL':
-        security_logger.critical("Security Event", extra=log_data)
-    elif severity == 'ERROR':
-        security_logger.error("Security Event", extra=log_data)
-    else:
-        security_logger.warning("Security Event", extra=log_data)
+    _SECURITY_LOG.log(level, "Security Event", extra=log_data)
 
 def log_performance_metric(metric_name, value, unit='ms', tags=None):
     """Log performance metrics"""
-    performance_logger = logging.getLogger('performance')
+    if not _PERFORMANCE_LOG.isEnabledFor(logging.INFO):
+        return
     
     log_data = {
         'metric_name': metric_name,
@@ -223,11 +318,12 @@ def log_performance_metric(metric_name, value, unit='ms', tags=None):
         'tags': tags or {}
     }
     
-    performance_logger.info("Performance Metric", extra=log_data)
+    _PERFORMANCE_LOG.info("Performance Metric", extra=log_data)
 
 def log_business_event(event_type, details, user_id=None):
     """Log business-related events"""
-    app_logger = logging.getLogger('business')
+    if not _BUSINESS_LOG.isEnabledFor(logging.INFO):
+        return
     
     log_data = {
         'event_type': event_type,
@@ -237,7 +333,7 @@ def log_business_event(event_type, details, user_id=None):
     if user_id:
         log_data['user_id'] = user_id
     
-    app_logger.info("Business Event", extra=log_data)
+    _BUSINESS_LOG.info("Business Event", extra=log_data)
 
 class RequestLoggingMiddleware:
     """Middleware to log all HTTP requests"""
@@ -249,17 +345,12 @@ class RequestLoggingMiddleware:
     
     def before_request(self):
         """Called before each request"""
-        from flask import g
-        import time
-        g.start_time = time.time()
+        g.start_time = time.perf_counter()
     
     def after_request(self, response):
         """Called after each request"""
-        from flask import g, request
-        import time
-        
-        if hasattr(g, 'start_time'):
-            duration = time.time() - g.start_time
-            log_request(request, response, duration)
+        start_time = g.get('start_time')
+        if start_time is not None:
+            log_request(flask_request, response, time.perf_counter() - start_time)
         
         return response
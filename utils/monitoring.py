@@ -1,14 +1,20 @@
 # utils/monitoring.py - Application Monitoring and Health Checks
 
+import os
 import psutil
+import asyncio
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from flask import jsonify, current_app
 from sqlalchemy import text
 from models import db
 import redis
-import requests
+import httpx
+import smtplib
+import socket
 
 logger = logging.getLogger(__name__)
 
@@ -23,15 +29,94 @@ class HealthChecker:
     def init_app(self, app):
         """Initialize with Flask app"""
         self.app = app
+        
+        # Long-lived pool so /health does not spawn threads per request
+        self._executor = ThreadPoolExecutor(
+            max_workers=app.config.get('HEALTH_CHECK_WORKERS', 8),
+            thread_name_prefix='health-check'
+        )
+        
+        # Share one result between pollers (load balancers, scrapers) for a few seconds
+        self._cache = None
+        self._cache_ts = 0.0
+        self._cache_ttl = app.config.get('HEALTH_CACHE_TTL_S', 2.0)
+        self._cache_lock = threading.Lock()
+        
+        # System gauges refreshed by a background sampler so probes never block.
+        # The sampler starts on first use in each process: threads do not
+        # survive fork, so one started before gunicorn forks would leave the
+        # workers reading the parent's frozen values.
+        self._cpu_gauge = None
+        self._mem_gauge = None
+        self._disk_gauge = None
+        self._sample_interval = app.config.get('SYSTEM_SAMPLE_INTERVAL_S', 5.0)
+        self._sampler_pid = None
+        self._sampler_lock = threading.Lock()
+        
+        # External probes run as coroutines on one background event loop,
+        # created lazily so each forked worker gets its own
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._http = None  # httpx.AsyncClient, bound to self._loop
+        self._smtp_clients = {}
+        self._smtp_lock = threading.Lock()
+        
+        # One pooled client for every probe instead of a new connection each time
+        self._redis = None
+        redis_url = app.config.get('REDIS_URL')
+        if redis_url:
+            self._redis = redis.Redis(connection_pool=redis.ConnectionPool.from_url(
+                redis_url,
+                max_connections=app.config.get('REDIS_POOL_MAX', 16),
+                socket_timeout=1,
+                socket_connect_timeout=1
+            ))
+        
+        # Last successful PING; recent successes are trusted without a new command
+        self._redis_last_ok_ts = 0.0
+        self._redis_last_ok = None
+    
+    def _ensure_sampler(self):
+        """Start the gauge sampler if this process does not have one yet"""
+        pid = os.getpid()
+        if self._sampler_pid != pid:
+            with self._sampler_lock:
+                if self._sampler_pid != pid:
+                    # Anything inherited across a fork is stale
+                    self._cpu_gauge = self._mem_gauge = self._disk_gauge = None
+                    threading.Thread(target=self._sample_system, name='health-sampler', daemon=True).start()
+                    self._sampler_pid = pid
+    
+    def _sample_system(self):
+        """Keep CPU, memory and disk gauges fresh in the background"""
+        while True:
+            try:
+                self._mem_gauge = psutil.virtual_memory()
+                self._disk_gauge = psutil.disk_usage('/')
+                # Blocks for the interval and averages CPU over it
+                self._cpu_gauge = psutil.cpu_percent(interval=self._sample_interval)
+            except Exception as e:
+                logger.error(f"System sampling failed: {e}")
+                time.sleep(self._sample_interval)
+    
+    def _db_pool_status(self):
+        """Connection counts from the engine's pool (QueuePool exposes these)"""
+        pool = db.engine.pool
+        status = {}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            counter = getattr(pool, name, None)
+            if callable(counter):
+                status[name] = counter()
+        return status
     
     def check_database(self):
         """Check database connectivity and performance"""
         try:
             start_time = time.time()
             
-            # Simple query to test connection
-            result = db.session.execute(text('SELECT 1'))
-            result.fetchone()
+            # Check out a pooled connection (pre-pinged) and make a round trip
+            with db.engine.connect() as connection:
+                connection.execute(text('SELECT 1')).fetchone()
             
             response_time = (time.time() - start_time) * 1000  # Convert to ms
             
@@ -42,13 +127,15 @@ class HealthChecker:
                 return {
                     'status': 'warning',
                     'message': f'Database response time high: {response_time:.2f}ms',
-                    'response_time_ms': response_time
+                    'response_time_ms': response_time,
+                    'pool': self._db_pool_status()
                 }
             
             return {
                 'status': 'healthy',
                 'message': 'Database connection successful',
-                'response_time_ms': response_time
+                'response_time_ms': response_time,
+                'pool': self._db_pool_status()
             }
         
         except Exception as e:
@@ -62,40 +149,39 @@ class HealthChecker:
     def check_redis(self):
         """Check Redis connectivity"""
         try:
-            redis_url = self.app.config.get('REDIS_URL')
-            if not redis_url:
+            if self._redis is None:
                 return {
                     'status': 'not_configured',
                     'message': 'Redis not configured'
                 }
             
-            start_time = time.time()
-            
-            # Connect to Redis
-            r = redis.from_url(redis_url)
+            # Skip the round trip if Redis answered recently (test-on-borrow style)
+            min_interval = self.app.config.get('REDIS_PING_MIN_INTERVAL_S', 10)
+            if self._redis_last_ok is not None and time.monotonic() - self._redis_last_ok_ts < min_interval:
+                return self._redis_last_ok
             
-            # Test basic operations
-            test_key = 'health_check_test'
-            r.set(test_key, 'test_value', ex=10)  # Expire in 10 seconds
-            value = r.get(test_key)
-            r.delete(test_key)
-            
-            response_time = (time.time() - start_time) * 1000
+            start_time = time.time()
             
-            if value.decode() != 'test_value':
+            # A single PING is enough for liveness
+            if not self._redis.ping():
                 return {
                     'status': 'unhealthy',
-                    'message': 'Redis read/write test failed',
-                    'response_time_ms': response_time
+                    'message': 'Redis PING failed',
+                    'response_time_ms': (time.time() - start_time) * 1000
                 }
             
-            return {
+            response_time = (time.time() - start_time) * 1000
+            
+            self._redis_last_ok = {
                 'status': 'healthy',
                 'message': 'Redis connection successful',
                 'response_time_ms': response_time
             }
+            self._redis_last_ok_ts = time.monotonic()
+            return self._redis_last_ok
         
         except Exception as e:
+            self._redis_last_ok = None
             logger.error(f"Redis health check failed: {e}")
             return {
                 'status': 'unhealthy',
@@ -106,7 +192,8 @@ class HealthChecker:
     def check_disk_space(self):
         """Check available disk space"""
         try:
-            disk_usage = psutil.disk_usage('/')
+            self._ensure_sampler()
+            disk_usage = self._disk_gauge or psutil.disk_usage('/')
             
             # Calculate percentages
             used_percent = (disk_usage.used / disk_usage.total) * 100
@@ -144,7 +231,8 @@ class HealthChecker:
     def check_memory_usage(self):
         """Check memory usage"""
         try:
-            memory = psutil.virtual_memory()
+            self._ensure_sampler()
+            memory = self._mem_gauge or psutil.virtual_memory()
             
             used_percent = memory.percent
             available_gb = memory.available / (1024**3)
@@ -181,8 +269,12 @@ class HealthChecker:
     def check_cpu_usage(self):
         """Check CPU usage"""
         try:
-            # Get CPU usage over a short interval
-            cpu_percent = psutil.cpu_percent(interval=1)
+            self._ensure_sampler()
+            # Latest background sample; until the first one lands, a
+            # non-blocking read since the previous call
+            cpu_percent = self._cpu_gauge
+            if cpu_percent is None:
+                cpu_percent = psutil.cpu_percent(interval=None)
             cpu_count = psutil.cpu_count()
             
             # Thresholds
@@ -213,29 +305,63 @@ class HealthChecker:
                 'message': f'CPU check failed: {str(e)}'
             }
     
+    def _event_loop(self):
+        """Event loop running on a daemon thread for the external probes"""
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='health-io', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+    
     def check_external_services(self):
         """Check external service dependencies"""
-        services = {}
+        probes = {}
         
         # Check WhatsApp service if enabled
         if self.app.config.get('ENABLE_WHATSAPP', False):
             whatsapp_url = self.app.config.get('WHATSAPP_API_URL')
             if whatsapp_url:
-                services['whatsapp'] = self._check_http_service(whatsapp_url, 'WhatsApp API')
+                probes['whatsapp'] = self._check_http_service(whatsapp_url, 'WhatsApp API')
         
         # Check email service if enabled
         if self.app.config.get('ENABLE_EMAIL_NOTIFICATIONS', False):
             smtp_server = self.app.config.get('MAIL_SERVER')
             if smtp_server:
-                services['email'] = self._check_smtp_service(smtp_server, 'Email Service')
+                probes['email'] = asyncio.to_thread(self._check_smtp_service, smtp_server, 'Email Service')
         
-        return services
+        if not probes:
+            return {}
+        
+        # All probes in flight at once on the shared loop; total time is the slowest one
+        async def gather():
+            return await asyncio.gather(*probes.values())
+        
+        # Strictly inside the overall health-check budget, so this result (not
+        # the outer as_completed timeout) reports a hung probe and the shared
+        # executor worker is released
+        timeout = 0.75 * self.app.config.get('HEALTH_CHECK_TIMEOUT_S', 2.0)
+        future = asyncio.run_coroutine_threadsafe(gather(), self._event_loop())
+        try:
+            results = future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            return {
+                name: {'status': 'unhealthy', 'message': f'Check timed out after {timeout:g}s'}
+                for name in probes
+            }
+        return dict(zip(probes, results))
     
-    def _check_http_service(self, url, service_name, timeout=5):
+    async def _check_http_service(self, url, service_name, timeout=5):
         """Check HTTP service availability"""
         try:
+            if self._http is None:
+                # Created on the loop thread; keeps connections alive between probes
+                self._http = httpx.AsyncClient(limits=httpx.Limits(max_connections=8, max_keepalive_connections=4))
+            
             start_time = time.time()
-            response = requests.get(url, timeout=timeout)
+            response = await self._http.get(url, timeout=timeout)
             response_time = (time.time() - start_time) * 1000
             
             if response.status_code == 200:
@@ -253,7 +379,7 @@ class HealthChecker:
                     'status_code': response.status_code
                 }
         
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             return {
                 'status': 'unhealthy',
                 'message': f'{service_name} timeout after {timeout}s'
@@ -264,17 +390,30 @@ class HealthChecker:
                 'message': f'{service_name} check failed: {str(e)}'
             }
     
+    def _smtp_noop(self, smtp_server):
+        """NOOP on a cached SMTP connection, reconnecting once if it was dropped"""
+        with self._smtp_lock:
+            server = self._smtp_clients.get(smtp_server)
+            if server is not None:
+                try:
+                    code, _ = server.noop()
+                    if code == 250:
+                        return
+                except smtplib.SMTPServerDisconnected:
+                    pass
+                self._smtp_clients.pop(smtp_server, None)
+            
+            server = smtplib.SMTP(smtp_server, timeout=5)
+            self._smtp_clients[smtp_server] = server
+            server.noop()
+    
     def _check_smtp_service(self, smtp_server, service_name):
         """Check SMTP service availability"""
         try:
-            import smtplib
-            import socket
-            
             start_time = time.time()
             
-            # Try to connect to SMTP server
-            server = smtplib.SMTP(smtp_server, timeout=5)
-            server.quit()
+            # Reuse the connection from the previous probe
+            self._smtp_noop(smtp_server)
             
             response_time = (time.time() - start_time) * 1000
             
@@ -295,8 +434,64 @@ class HealthChecker:
                 'message': f'{service_name} check failed: {str(e)}'
             }
     
-    def get_comprehensive_health(self):
-        """Get comprehensive health status"""
+    def _run_check(self, check):
+        """Run a single check on a worker thread inside an app context"""
+        with self.app.app_context():
+            return check()
+    
+    def get_comprehensive_health(self, use_cache=True):
+        """Get comprehensive health status
+        
+        Results are reused for HEALTH_CACHE_TTL_S seconds; pass
+        use_cache=False to force a fresh run.
+        """
+        # Concurrent callers wait on the lock and then pick up the fresh result
+        with self._cache_lock:
+            if use_cache and self._cache is not None and time.monotonic() - self._cache_ts < self._cache_ttl:
+                return self._cache
+            
+            health_checks = self._run_health_checks()
+            self._cache = health_checks
+            self._cache_ts = time.monotonic()
+            return health_checks
+    
+    def _run_health_checks(self):
+        """Run every check and work out the overall status"""
+        checks = {
+            ('database',): self.check_database,
+            ('redis',): self.check_redis,
+            ('system', 'disk'): self.check_disk_space,
+            ('system', 'memory'): self.check_memory_usage,
+            ('system', 'cpu'): self.check_cpu_usage,
+            ('external_services',): self.check_external_services,
+        }
+        
+        # Run every check at once so the endpoint takes as long as the slowest
+        # one rather than the sum of all of them
+        futures = {self._executor.submit(self._run_check, check): key for key, check in checks.items()}
+        results = {}
+        timeout = self.app.config.get('HEALTH_CHECK_TIMEOUT_S', 2.0)
+        
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    logger.error(f"Health check {'.'.join(key)} failed: {e}")
+                    results[key] = {
+                        'status': 'unhealthy',
+                        'message': f'Check failed: {str(e)}'
+                    }
+        except TimeoutError:
+            for key in checks:
+                if key not in results:
+                    logger.warning(f"Health check {'.'.join(key)} timed out after {timeout}s")
+                    results[key] = {
+                        'status': 'unhealthy',
+                        'message': 'check timed out'
+                    }
+        
         health_checks = {
             'timestamp': datetime.utcnow().isoformat(),
             'application': {
@@ -304,14 +499,14 @@ class HealthChecker:
                 'version': self.app.config.get('VERSION', '1.0.0'),
                 'environment': self.app.config.get('FLASK_ENV', 'production')
             },
-            'database': self.check_database(),
-            'redis': self.check_redis(),
+            'database': results[('database',)],
+            'redis': results[('redis',)],
             'system': {
-                'disk': self.check_disk_space(),
-                'memory': self.check_memory_usage(),
-                'cpu': self.check_cpu_usage()
+                'disk': results[('system', 'disk')],
+                'memory': results[('system', 'memory')],
+                'cpu': results[('system', 'cpu')]
             },
-            'external_services': self.check_external_services()
+            'external_services': results[('external_services',)]
         }
         
         # Determine overall status
@@ -1,25 +1,136 @@
 # utils/security.py - Security Enhancement Module
 
+import os
 import hashlib
+import hmac
+import inspect
+import json
+import atexit
+import queue
 import secrets
 import logging
+import threading
+import time
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 from functools import wraps
 from flask import request, abort, current_app, session, g
 from flask_login import current_user
-from collections import defaultdict
+from collections import defaultdict, deque
 import ipaddress
+import redis
 
 logger = logging.getLogger(__name__)
 
+# Compiled once at import for the per-request sanitizer and password checks
+_STRIP_CHARS = str.maketrans('', '', '<>"\'')
+_SQL_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(\b(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|UNION)\b)',
+    r'(--|#|/\*|\*/)',
+    r'(\bOR\b.*=.*\bOR\b)',
+    r'(\bAND\b.*=.*\bAND\b)'
+))
+
+# n=2**14, r=8 needs 16 MiB per hash; well under OpenSSL's default 32 MiB maxmem
+_SCRYPT_PARAMS = {'n': 2 ** 14, 'r': 8, 'p': 1, 'dklen': 32}
+
+# Identical for every response, so built once
+SECURITY_HEADERS = {
+    'X-Content-Type-Options': 'nosniff',
+    'X-Frame-Options': 'DENY',
+    'X-XSS-Protection': '1; mode=block',
+    'Strict-Transport-Security': 'max-age=31536000; includeSubDomains',
+    'Referrer-Policy': 'strict-origin-when-cross-origin',
+    # Content Security Policy
+    'Content-Security-Policy': (
+        "default-src 'self'; "
+        "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com; "
+        "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com; "
+        "img-src 'self' data: https:; "
+        "font-src 'self' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com; "
+        "connect-src 'self'; "
+        "frame-ancestors 'none';"
+    ),
+}
+
+# Leading magic bytes for the image types accepted by validate_file_upload
+_IMAGE_SIGNATURES = {
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'gif': (b'GIF87a', b'GIF89a'),
+}
+
+# Shared rate-limit / block state so every gunicorn worker sees the same counters
+_BLOCKED_IPS_KEY = 'security:blocked_ips'
+_ATTEMPTS_KEY = 'security:attempts:{}'
+
+_PWD_UPPER = re.compile(r'[A-Z]')
+_PWD_LOWER = re.compile(r'[a-z]')
+_PWD_DIGIT = re.compile(r'\d')
+_PWD_SPECIAL = re.compile(r'[!@#$%^&*(),.?":{}|<>]')
+_COMMON_PASSWORDS = frozenset((
+    'password', '123456', 'password123', 'admin', 'qwerty',
+    'letmein', 'welcome', 'monkey', '1234567890'
+))
+
+class IPBlockList:
+    """Blocked single addresses and CIDR ranges
+    
+    Single hosts live in a set of canonical strings (so '::1' and
+    '0:0:0:0:0:0:0:1' match). Ranges are grouped by prefix length; a lookup
+    masks the address once per distinct prefix length and does a set lookup.
+    """
+    
+    def __init__(self, entries=()):
+        self.hosts = set()
+        self.networks = defaultdict(set)  # (version, prefixlen) -> {network}
+        for entry in entries:
+            self.add(entry)
+    
+    def add(self, entry):
+        """Add an address or CIDR; returns its canonical string form"""
+        try:
+            network = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            # Not an IP (e.g. a malformed forwarded header); match it verbatim
+            self.hosts.add(entry)
+            return entry
+        
+        if network.prefixlen == network.max_prefixlen:
+            canonical = str(network.network_address)
+            self.hosts.add(canonical)
+            return canonical
+        
+        self.networks[(network.version, network.prefixlen)].add(network)
+        return str(network)
+    
+    def __contains__(self, ip):
+        if ip in self.hosts:
+            return True
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return False
+        
+        if str(address) in self.hosts:
+            return True
+        for (version, prefixlen), networks in self.networks.items():
+            if version == address.version and \
+                    ipaddress.ip_network((address, prefixlen), strict=False) in networks:
+                return True
+        return False
+    
+    def __len__(self):
+        return len(self.hosts) + sum(len(networks) for networks in self.networks.values())
+
 class SecurityManager:
     """Comprehensive security management system"""
     
     def __init__(self, app=None):
         self.app = app
         self.failed_attempts = defaultdict(list)
-        self.blocked_ips = set()
+        self.blocked_ips = IPBlockList()
         self.suspicious_activities = defaultdict(list)
         
         if app:
@@ -35,6 +146,43 @@ class SecurityManager:
         self.rate_limit_requests = app.config.get('RATE_LIMIT_REQUESTS', 100)
         self.rate_limit_window = app.config.get('RATE_LIMIT_WINDOW_MINUTES', 15)
         
+        # Per-IP monotonic timestamps, oldest first; bounded so a noisy IP
+        # cannot grow its history without limit
+        history_cap = max(self.rate_limit_requests, self.max_login_attempts)
+        self.failed_attempts = defaultdict(lambda: deque(maxlen=history_cap))
+        # Guards append/prune/forget; requests for the same IP run concurrently
+        self._attempts_lock = threading.Lock()
+        
+        # Redis-backed state when REDIS_URL is set; the in-process structures
+        # above remain the fallback if Redis is unreachable
+        self._redis = None
+        redis_url = app.config.get('REDIS_URL')
+        if redis_url:
+            self._redis = redis.Redis(connection_pool=redis.ConnectionPool.from_url(
+                redis_url,
+                max_connections=app.config.get('REDIS_POOL_MAX', 16),
+                socket_timeout=1,
+                socket_connect_timeout=1
+            ))
+        self._blocked_cache = IPBlockList()
+        self._blocked_cache_ts = 0.0
+        self._blocked_cache_ttl = app.config.get('BLOCKED_IPS_CACHE_TTL_S', 1.0)
+        
+        # Bodies and headers for rejected requests, built once. /api clients
+        # get the same JSON shape as the api blueprint's error handlers.
+        self._blocked_reply = (
+            b'Forbidden',
+            json.dumps({'error': 'Forbidden', 'message': 'Insufficient permissions'}).encode(),
+            403,
+            {}
+        )
+        self._rate_limited_reply = (
+            b'Too Many Requests',
+            json.dumps({'error': 'Too many requests', 'message': 'Rate limit exceeded'}).encode(),
+            429,
+            {'Retry-After': str(self.rate_limit_window * 60)}
+        )
+        
         # Setup security middleware
         app.before_request(self.before_request_security_check)
         app.after_request(self.after_request_security_headers)
@@ -46,38 +194,31 @@ class SecurityManager:
         # Check if IP is blocked
         if self.is_ip_blocked(client_ip):
             logger.warning(f"Blocked IP attempted access: {client_ip}")
-            abort(403)
+            return self._reject(*self._blocked_reply)
         
         # Rate limiting
         if self.is_rate_limited(client_ip):
             logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-            abort(429)
+            return self._reject(*self._rate_limited_reply)
         
         # Store request info for logging
         g.client_ip = client_ip
-        g.request_start_time = datetime.utcnow()
+        # Only ever used for durations, so a monotonic counter is enough
+        g.request_start_time = time.monotonic()
+    
+    def _reject(self, text_body, json_body, status, headers):
+        """Short-circuit response for dropped requests (no abort/error-handler round trip)
+        
+        A fresh response each time: after_request hooks add headers and
+        cookies, so a shared instance would leak them between requests.
+        """
+        if request.blueprint == 'api':
+            return self.app.response_class(json_body, status=status, headers=headers, mimetype='application/json')
+        return self.app.response_class(text_body, status=status, headers=headers, mimetype='text/plain')
     
     def after_request_security_headers(self, response):
         """Add security headers to response"""
-        # Security headers
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        response.headers['X-Frame-Options'] = 'DENY'
-        response.headers['X-XSS-Protection'] = '1; mode=block'
-        response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
-        response.headers['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-        
-        # Content Security Policy
-        csp = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com; "
-            "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com; "
-            "img-src 'self' data: https:; "
-            "font-src 'self' https://cdn.jsdelivr.net https://cdnjs.cloudflare.com; "
-            "connect-src 'self'; "
-            "frame-ancestors 'none';"
-        )
-        response.headers['Content-Security-Policy'] = csp
-        
+        response.headers.update(SECURITY_HEADERS)
         return response
     
     def get_client_ip(self):
@@ -93,11 +234,31 @@ class SecurityManager:
     
     def is_ip_blocked(self, ip_address):
         """Check if IP address is blocked"""
+        if self._redis is not None:
+            # Refresh the shared block list at most once per TTL, not per request
+            now = time.monotonic()
+            if now - self._blocked_cache_ts >= self._blocked_cache_ttl:
+                try:
+                    self._blocked_cache = IPBlockList(
+                        member.decode() for member in self._redis.smembers(_BLOCKED_IPS_KEY)
+                    )
+                except redis.RedisError as e:
+                    logger.error(f"Failed to load blocked IPs from Redis: {e}")
+                # Back off on failure too, so a dead Redis is not retried per request
+                self._blocked_cache_ts = now
+            if ip_address in self._blocked_cache:
+                return True
+        
         return ip_address in self.blocked_ips
     
     def block_ip(self, ip_address, reason="Security violation"):
-        """Block an IP address"""
-        self.blocked_ips.add(ip_address)
+        """Block an IP address or a CIDR range such as 203.0.113.0/24"""
+        ip_address = self.blocked_ips.add(ip_address)
+        if self._redis is not None:
+            try:
+                self._redis.sadd(_BLOCKED_IPS_KEY, ip_address)
+            except redis.RedisError as e:
+                logger.error(f"Failed to store blocked IP in Redis: {e}")
         logger.warning(f"IP blocked: {ip_address}, Reason: {reason}")
         
         # Log security event
@@ -108,36 +269,60 @@ class SecurityManager:
             'ERROR'
         )
     
+    def _count_attempts(self, ip_address, window_seconds, record=False):
+        """Count (and optionally record) attempts from an IP within a window"""
+        if self._redis is not None:
+            # Sliding window in a sorted set scored by wall-clock time
+            key = _ATTEMPTS_KEY.format(ip_address)
+            now = time.time()
+            try:
+                pipe = self._redis.pipeline()
+                if record:
+                    pipe.zadd(key, {f"{now}:{secrets.token_hex(4)}": now})
+                pipe.zremrangebyscore(key, 0, now - window_seconds)
+                pipe.zcard(key)
+                pipe.expire(key, max(self.rate_limit_window, self.lockout_duration) * 60)
+                return pipe.execute()[-2]
+            except redis.RedisError as e:
+                logger.error(f"Redis rate-limit check failed, using local state: {e}")
+        
+        with self._attempts_lock:
+            if record:
+                self.failed_attempts[ip_address].append(time.monotonic())
+            return len(self._prune_attempts(ip_address, window_seconds))
+    
+    def _prune_attempts(self, ip_address, window_seconds):
+        """Drop timestamps older than the window; returns the remaining deque
+        
+        Callers hold _attempts_lock.
+        """
+        attempts = self.failed_attempts.get(ip_address)
+        if attempts is None:
+            return ()
+        
+        window_start = time.monotonic() - window_seconds
+        while attempts and attempts[0] <= window_start:
+            attempts.popleft()
+        
+        # Forget IPs with nothing left instead of keeping empty entries forever
+        if not attempts:
+            self.failed_attempts.pop(ip_address, None)
+        return attempts
+    
     def is_rate_limited(self, ip_address):
         """Check if IP is rate limited"""
-        now = datetime.utcnow()
-        window_start = now - timedelta(minutes=self.rate_limit_window)
-        
-        # Clean old entries
-        self.failed_attempts[ip_address] = [
-            timestamp for timestamp in self.failed_attempts[ip_address]
-            if timestamp > window_start
-        ]
+        attempts = self._count_attempts(ip_address, self.rate_limit_window * 60)
         
         # Check if rate limit exceeded
-        return len(self.failed_attempts[ip_address]) >= self.rate_limit_requests
+        return attempts >= self.rate_limit_requests
     
     def record_failed_login(self, username, ip_address):
         """Record a failed login attempt"""
-        now = datetime.utcnow()
-        
-        # Record the attempt
-        self.failed_attempts[ip_address].append(now)
-        
-        # Clean old attempts
-        cutoff_time = now - timedelta(minutes=self.lockout_duration)
-        self.failed_attempts[ip_address] = [
-            timestamp for timestamp in self.failed_attempts[ip_address]
-            if timestamp > cutoff_time
-        ]
+        # Record the attempt and drop the ones outside the lockout window
+        attempts = self._count_attempts(ip_address, self.lockout_duration * 60, record=True)
         
         # Check if should block IP
-        if len(self.failed_attempts[ip_address]) >= self.max_login_attempts:
+        if attempts >= self.max_login_attempts:
             self.block_ip(ip_address, f"Too many failed login attempts for user: {username}")
         
         # Log security event
@@ -147,7 +332,7 @@ class SecurityManager:
             {
                 'username': username,
                 'ip_address': ip_address,
-                'attempt_count': len(self.failed_attempts[ip_address])
+                'attempt_count': attempts
             },
             'WARNING'
         )
@@ -155,8 +340,13 @@ class SecurityManager:
     def record_successful_login(self, username, ip_address):
         """Record a successful login"""
         # Clear failed attempts for this IP
-        if ip_address in self.failed_attempts:
-            del self.failed_attempts[ip_address]
+        with self._attempts_lock:
+            self.failed_attempts.pop(ip_address, None)
+        if self._redis is not None:
+            try:
+                self._redis.delete(_ATTEMPTS_KEY.format(ip_address))
+            except redis.RedisError as e:
+                logger.error(f"Failed to clear attempts in Redis: {e}")
         
         # Log security event
         from utils.logging_config import log_security_event
@@ -173,25 +363,20 @@ class SecurityManager:
         if len(password) < 8:
             errors.append("Password must be at least 8 characters long")
         
-        if not re.search(r'[A-Z]', password):
+        if not _PWD_UPPER.search(password):
             errors.append("Password must contain at least one uppercase letter")
         
-        if not re.search(r'[a-z]', password):
+        if not _PWD_LOWER.search(password):
             errors.append("Password must contain at least one lowercase letter")
         
-        if not re.search(r'\d', password):
+        if not _PWD_DIGIT.search(password):
             errors.append("Password must contain at least one digit")
         
-        if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
+        if not _PWD_SPECIAL.search(password):
             errors.append("Password must contain at least one special character")
         
         # Check for common passwords
-        common_passwords = [
-            'password', '123456', 'password123', 'admin', 'qwerty',
-            'letmein', 'welcome', 'monkey', '1234567890'
-        ]
-        
-        if password.lower() in common_passwords:
+        if password.lower() in _COMMON_PASSWORDS:
             errors.append("Password is too common")
         
         return errors
@@ -202,19 +387,34 @@ class SecurityManager:
     
     def hash_sensitive_data(self, data):
         """Hash sensitive data for storage"""
+        # scrypt is memory-hard and a single call instead of 100k PBKDF2 rounds
         salt = secrets.token_hex(16)
-        hashed = hashlib.pbkdf2_hmac('sha256', data.encode(), salt.encode(), 100000)
-        return f"{salt}:{hashed.hex()}"
+        hashed = hashlib.scrypt(data.encode(), salt=salt.encode(), **_SCRYPT_PARAMS)
+        return f"scrypt${salt}${hashed.hex()}"
     
     def verify_hashed_data(self, data, hashed_data):
         """Verify hashed sensitive data"""
         try:
-            salt, hash_hex = hashed_data.split(':')
-            hashed = hashlib.pbkdf2_hmac('sha256', data.encode(), salt.encode(), 100000)
-            return hashed.hex() == hash_hex
+            if hashed_data.startswith('scrypt$'):
+                _, salt, hash_hex = hashed_data.split('$')
+                hashed = hashlib.scrypt(data.encode(), salt=salt.encode(), **_SCRYPT_PARAMS)
+            else:
+                # Values stored before the switch to scrypt
+                salt, hash_hex = hashed_data.split(':')
+                hashed = hashlib.pbkdf2_hmac('sha256', data.encode(), salt.encode(), 100000)
+            return hmac.compare_digest(hashed.hex(), hash_hex)
         except ValueError:
             return False
 
+def _cached_access_check(kind, name, check):
+    """Memoize a role/permission check for the rest of the current request"""
+    cache = g.setdefault('_access_checks', {})
+    key = (kind, name)
+    allowed = cache.get(key)
+    if allowed is None:
+        allowed = cache[key] = bool(check(name))
+    return allowed
+
 def require_role(required_role):
     """Decorator to require specific user role"""
     def decorator(f):
@@ -223,7 +423,7 @@ def require_role(required_role):
             if not current_user.is_authenticated:
                 abort(401)
             
-            if not current_user.has_role(required_role):
+            if not _cached_access_check('role', required_role, current_user.has_role):
                 logger.warning(
                     f"Unauthorized access attempt by user {current_user.username} "
                     f"to role-restricted endpoint requiring {required_role}"
@@ -242,7 +442,9 @@ def require_permission(permission):
             if not current_user.is_authenticated:
                 abort(401)
             
-            if not current_user.has_permission(permission):
+            # User models without has_permission expose resource checks as can_access
+            check = getattr(current_user, 'has_permission', None) or current_user.can_access
+            if not _cached_access_check('permission', permission, check):
                 logger.warning(
                     f"Unauthorized access attempt by user {current_user.username} "
                     f"to permission-restricted endpoint requiring {permission}"
@@ -253,9 +455,84 @@ def require_permission(permission):
         return decorated_function
     return decorator
 
-def audit_log(action):
-    """Decorator to log user actions for audit trail"""
+# Audit entries are written by a background thread in batches, off the request path.
+# Durability trade-off: entries still queued when a worker dies without running
+# atexit (SIGKILL, OOM kill, hard crash) are lost, up to _AUDIT_FLUSH_INTERVAL
+# worth of actions.
+_AUDIT_QUEUE = queue.Queue()
+_AUDIT_BATCH_SIZE = 100
+_AUDIT_FLUSH_INTERVAL = 0.25  # seconds
+_audit_flusher = None
+_audit_flusher_lock = threading.Lock()
+
+def _write_audit_batch(batch):
+    """Insert queued (app, mapping) audit entries with one commit per app"""
+    from models import AuditLog, db
+    
+    by_app = defaultdict(list)
+    for app, entry in batch:
+        by_app[app].append(entry)
+    
+    for app, entries in by_app.items():
+        with app.app_context():
+            try:
+                db.session.bulk_insert_mappings(AuditLog, entries)
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Failed to log {len(entries)} audit entries: {e}")
+                db.session.rollback()
+
+def _flush_audit_queue():
+    """Collect up to _AUDIT_BATCH_SIZE entries or _AUDIT_FLUSH_INTERVAL, then write"""
+    while True:
+        batch = [_AUDIT_QUEUE.get()]
+        deadline = time.monotonic() + _AUDIT_FLUSH_INTERVAL
+        while len(batch) < _AUDIT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_AUDIT_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        _write_audit_batch(batch)
+
+def _drain_audit_queue():
+    """Write whatever is still queued when the process exits"""
+    batch = []
+    while True:
+        try:
+            batch.append(_AUDIT_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        _write_audit_batch(batch)
+
+atexit.register(_drain_audit_queue)
+
+def _enqueue_audit_entry(entry):
+    """Queue an audit row, starting the flusher thread in this process if needed"""
+    global _audit_flusher
+    if _audit_flusher is None:
+        with _audit_flusher_lock:
+            if _audit_flusher is None:
+                _audit_flusher = threading.Thread(
+                    target=_flush_audit_queue, name='audit-flusher', daemon=True
+                )
+                _audit_flusher.start()
+    _AUDIT_QUEUE.put((current_app._get_current_object(), entry))
+
+def audit_log(action, table_name, record_id_arg):
+    """Decorator to log user actions for audit trail
+    
+    ``table_name`` is the table the view acts on and ``record_id_arg`` the
+    name of the view argument holding the target row's id, e.g.
+    ``@audit_log('update', 'patients', 'patient_id')``.
+    """
     def decorator(f):
+        if record_id_arg not in inspect.signature(f).parameters:
+            raise TypeError(f"{f.__name__}() has no '{record_id_arg}' argument to audit")
+        
         @wraps(f)
         def decorated_function(*args, **kwargs):
             # Execute the function
@@ -263,22 +540,16 @@ def audit_log(action):
             
             # Log the action
             if current_user.is_authenticated:
-                from models import AuditLog, db
-                
-                audit_entry = AuditLog(
-                    user_id=current_user.id,
-                    action=action,
-                    details=f"Endpoint: {request.endpoint}, Method: {request.method}",
-                    ip_address=g.get('client_ip', request.remote_addr),
-                    user_agent=request.headers.get('User-Agent', '')
-                )
-                
-                try:
-                    db.session.add(audit_entry)
-                    db.session.commit()
-                except Exception as e:
-                    logger.error(f"Failed to log audit entry: {e}")
-                    db.session.rollback()
+                _enqueue_audit_entry({
+                    'user_id': current_user.id,
+                    'action': action,
+                    'table_name': table_name,
+                    'record_id': kwargs[record_id_arg],
+                    'new_values': f"Endpoint: {request.endpoint}, Method: {request.method}",
+                    'ip_address': g.get('client_ip', request.remote_addr),
+                    'user_agent': request.headers.get('User-Agent', ''),
+                    'created_at': datetime.now(timezone.utc)
+                })
             
             return result
         return decorated_function
@@ -290,61 +561,66 @@ def sanitize_input(input_string):
         return input_string
     
     # Remove potentially dangerous characters
-    sanitized = re.sub(r'[<>"\']', '', input_string)
+    sanitized = input_string.translate(_STRIP_CHARS)
     
     # Remove SQL injection patterns
-    sql_patterns = [
-        r'(\b(SELECT|INSERT|UPDATE|DELETE|DROP|CREATE|ALTER|EXEC|UNION)\b)',
-        r'(--|#|/\*|\*/)',
-        r'(\bOR\b.*=.*\bOR\b)',
-        r'(\bAND\b.*=.*\bAND\b)'
-    ]
-    
-    for pattern in sql_patterns:
-        sanitized = re.sub(pattern, '', sanitized, flags=re.IGNORECASE)
+    for pattern in _SQL_PATTERNS:
+        sanitized = pattern.sub('', sanitized)
     
     return sanitized.strip()
 
+def _allowed_extensions():
+    """Flattened ALLOWED_EXTENSIONS for the current app, computed once per app"""
+    allowed = current_app.extensions.get('allowed_upload_extensions')
+    if allowed is None:
+        configured = current_app.config.get('ALLOWED_EXTENSIONS', {
+            'images': ['jpg', 'jpeg', 'png', 'gif'],
+            'documents': ['pdf', 'doc', 'docx', 'txt'],
+            'data': ['csv', 'xlsx']
+        })
+        # Either grouped ({'images': [...], ...}) or a flat set as in config.py
+        groups = configured.values() if isinstance(configured, dict) else (configured,)
+        allowed = frozenset(ext.lower() for group in groups for ext in group)
+        current_app.extensions['allowed_upload_extensions'] = allowed
+    return allowed
+
 def validate_file_upload(file):
     """Validate uploaded files for security"""
     if not file or not file.filename:
         return False, "No file selected"
     
     # Check file extension
-    allowed_extensions = current_app.config.get('ALLOWED_EXTENSIONS', {
-        'images': ['jpg', 'jpeg', 'png', 'gif'],
-        'documents': ['pdf', 'doc', 'docx', 'txt'],
-        'data': ['csv', 'xlsx']
-    })
-    
-    all_allowed = []
-    for ext_list in allowed_extensions.values():
-        all_allowed.extend(ext_list)
-    
-    file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+    file_ext = os.path.splitext(file.filename)[1][1:].lower()
     
-    if file_ext not in all_allowed:
+    if file_ext not in _allowed_extensions():
         return False, f"File type '{file_ext}' not allowed"
     
     # Check file size
-    max_size = current_app.config.get('MAX_CONTENT_LENGTH', 16 * 1024 * 1024)  # 16MB
+    max_size = current_app.config.get('MAX_CONTENT_LENGTH') or 16 * 1024 * 1024  # 16MB
     
-    # Read file content to check size and content
-    file.seek(0, 2)  # Seek to end
-    file_size = file.tell()
-    file.seek(0)  # Reset to beginning
-    
-    if file_size > max_size:
-        return False, f"File too large. Maximum size: {max_size // (1024*1024)}MB"
+    # The whole request body bounds the file size; only measure the file
+    # itself when the body is larger than the limit (or its length unknown)
+    if not request.content_length or request.content_length > max_size:
+        file.seek(0, 2)  # Seek to end
+        file_size = file.tell()
+        file.seek(0)  # Reset to beginning
+        
+        if file_size > max_size:
+            return False, f"File too large. Maximum size: {max_size // (1024*1024)}MB"
     
     # Basic content validation
-    if file_ext in ['jpg', 'jpeg', 'png', 'gif']:
-        # Check if it's actually an image
-        try:
-            from PIL import Image
-            Image.open(file)
-            file.seek(0)  # Reset for actual upload
-        except Exception:
-            return False, "Invalid image file"
+    if file_ext in _IMAGE_SIGNATURES:
+        # Check if it's actually an image from its first bytes
+        header = file.read(16)
+        file.seek(0)
+        if not header.startswith(_IMAGE_SIGNATURES[file_ext]):
+            # Unusual variant; let PIL check the structure without decoding pixels
+            try:
+                from PIL import Image
+                Image.open(file).verify()
+            except Exception:
+                return False, "Invalid image file"
+            finally:
+                file.seek(0)  # Reset for actual upload
     
     return True, "File is valid"